@@ -3,12 +3,24 @@ import json
 import datetime
 import glob
 import numpy as np
-import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # headless: never pick a GUI backend in web workers or batch runs
 import matplotlib.pyplot as plt
-from database import engine
+from data_access import load_table, get_table_version
+from sampling import EmployeeSampler
+from cluster_sql import SqlSampler
+from render_pool import run_tasks
+from manifests import manifest_entry, save_manifests, WRITE_SAMPLE_CSVS
+import render_cache
+import renderers
+import images
+from metrics import timed
+
+# Everything besides samples, seed, data and output options that changes the pixels; bump on style changes
+ABSTRACT_PLOT_PARAMS = {"style": "abstract", "figsize": [22, 12], "min_size": 350, "revision": 1}
 
 def clean_static_folder():
-    files = glob.glob("static/visual_*.png")
+    files = glob.glob("static/visual_*.*")
     for file in files:
         os.remove(file)
     if os.path.exists("static/visuals.json"):
@@ -20,32 +32,18 @@ def clean_static_folder():
         os.makedirs("static/samples")
 
 def load_data():
-    table_name = "cleaned_salary_data2"
-    with engine.connect() as conn:
-        df = pd.read_sql(f"SELECT * FROM {table_name};", conn)
+    df = load_table("cleaned_salary_data2")
 
     required_columns = {"Gender", "TotalWorkingYears", "Age", "MonthlyIncome", "EmployeeID"}
     if not required_columns.issubset(df.columns):
         raise ValueError("Dataset is missing required columns.")
     return df
 
-def generate_random_sample(df, used_ids, sample_size):
-    remaining_df = df[~df["EmployeeID"].isin(used_ids)]
-    males = remaining_df[remaining_df["Gender"] == "Male"]
-    females = remaining_df[remaining_df["Gender"] == "Female"]
+@timed("sampling", kind="abstract")
+def generate_random_sample(sampler, sample_size):
+    return sampler.draw_pair("Male", "Female", sample_size)
 
-    if len(males) < sample_size or len(females) < sample_size:
-        raise ValueError("Not enough unique samples left.")
-
-    male_sample = males.sample(n=sample_size, replace=False)
-    female_sample = females.sample(n=sample_size, replace=False)
-
-    used_ids.update(male_sample["EmployeeID"].tolist())
-    used_ids.update(female_sample["EmployeeID"].tolist())
-
-    return male_sample, female_sample
-
-def plot_abstract_visualization(male_sample, female_sample, image_path):
+def plot_abstract_visualization(male_sample, female_sample, image_path, seed=None, dpi=300):
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(22, 12), sharey=True)
     plt.subplots_adjust(wspace=0.2)  # 🔥 Add spacing between the two graphs
 
@@ -56,8 +54,9 @@ def plot_abstract_visualization(male_sample, female_sample, image_path):
     male_sizes = np.maximum(male_sample["MonthlyIncome"] * salary_scale_factor, min_size)
     female_sizes = np.maximum(female_sample["MonthlyIncome"] * salary_scale_factor, min_size)
 
-    jitter_y_male = np.random.uniform(-0.3, 0.3, size=len(male_sample))
-    jitter_y_female = np.random.uniform(-0.3, 0.3, size=len(female_sample))
+    rng = np.random.default_rng(seed)
+    jitter_y_male = rng.uniform(-0.3, 0.3, size=len(male_sample))
+    jitter_y_female = rng.uniform(-0.3, 0.3, size=len(female_sample))
 
     bright_red = "#ff4c4c"
     bright_blue = "#4da6ff"
@@ -108,45 +107,146 @@ def plot_abstract_visualization(male_sample, female_sample, image_path):
         spine.set_visible(False)
 
     fig.patch.set_facecolor('white')
-    plt.savefig(image_path, bbox_inches='tight', pad_inches=0, dpi=300)
+    fmt = os.path.splitext(image_path)[1].lstrip(".")
+    plt.savefig(image_path, bbox_inches='tight', pad_inches=0, format=fmt, **renderers.save_kwargs(fmt, dpi))
     plt.close()
 
 
 
-def save_metadata_list(metadata_list):
-    with open(os.path.join("static", "visuals.json"), "w") as f:
+@timed("file_write", target="visuals_json")
+def save_metadata_list(metadata_list, output_dir="static"):
+    with open(os.path.join(output_dir, "visuals.json"), "w") as f:
         json.dump(metadata_list, f, indent=4)
 
-def generate_multiple_samples(df, sample_size=7, iterations=5):
-    metadata_list = []
-    used_ids = set()
-
-    output_dir = "static"
+def draw_abstract(male_sample, female_sample, image_path, seed, backend, dpi):
+    with timed("render", kind="abstract", backend=backend):
+        if backend == "svg":
+            renderers.render_abstract_svg(male_sample, female_sample, image_path, seed=seed)
+        elif backend == "matplotlib":
+            plot_abstract_visualization(male_sample, female_sample, image_path, seed=seed, dpi=dpi)
+        else:
+            raise ValueError(f"Unknown render backend: {backend}")
+
+def render_abstract(male_sample, female_sample, image_path, seed, backend=None, dpi=None, data_version=None,
+                    thumbnails=False):
+    """Render one visual through the render cache; the samples must already be in plotted order.
+
+    Returns the cache hit flag, or (hit, [(width, thumbnail path)]) when thumbnails are requested.
+    """
+    backend = backend or renderers.RENDER_BACKEND
+    dpi = dpi or renderers.RENDER_DPI
+    params = {**ABSTRACT_PLOT_PARAMS, "backend": backend, "dpi": dpi, "format": os.path.splitext(image_path)[1]}
+    key = render_cache.render_key(male_sample, female_sample, seed, params, data_version)
+    hit = render_cache.cached_render(
+        key, image_path, lambda path: draw_abstract(male_sample, female_sample, path, seed, backend, dpi)
+    )
+    if not thumbnails:
+        return hit
+    return hit, images.write_thumbnails(image_path, key)
+
+def render_sample(task):
+    """Render one visual (or reuse a cached one); runs inside a render worker.
+
+    Sample CSVs are only written when the task asks for them: the manifest recorded by the
+    parent is enough to rebuild them (see manifests.sample_csv).
+    """
+    male_sample = task["male_sample"].sort_values("EmployeeID", kind="stable")
+    female_sample = task["female_sample"].sort_values("EmployeeID", kind="stable")
+
+    cache_hit, thumbnails = render_abstract(male_sample, female_sample, task["image_path"], task["seed"],
+                                            task["backend"], task["dpi"], task["data_version"], thumbnails=True)
+
+    if task["write_csv"]:
+        with timed("file_write", target="sample_csv"):
+            male_sample.to_csv(task["male_csv"], index=False)
+            female_sample.to_csv(task["female_csv"], index=False)
+
+    visual_path = os.path.relpath(task["image_path"], "static").replace(os.sep, "/")
+    manifest = manifest_entry(visual_path, "abstract", male_sample, female_sample, task["seed"],
+                              {"backend": task["backend"], "dpi": task["dpi"]}, task["data_version"])
+    return cache_hit, manifest, {
+        # Relative to static/ so templates can pass it straight to url_for('static', ...)
+        "visual_path": visual_path,
+        "description": f"Sample {task['index']}",
+        "timestamp": datetime.datetime.now().isoformat(),
+        **images.image_metadata(task["image_path"], thumbnails),
+    }
+
+def generate_multiple_samples(df, sample_size=7, iterations=5, seed=None, workers=None, on_progress=None,
+                              output_dir="static", data_version=None, backend=None, dpi=None, fmt=None,
+                              sampler=None, write_csv=None):
+    sample_seed, jitter_seed = np.random.SeedSequence(seed).spawn(2)
+    if sampler is None:
+        sampler = EmployeeSampler(df, seed=sample_seed)
+    jitter_seeds = np.random.default_rng(jitter_seed).integers(0, 2**32, size=iterations)
+
+    write_csv = WRITE_SAMPLE_CSVS if write_csv is None else write_csv
+    os.makedirs(output_dir, exist_ok=True)
     sample_dir = os.path.join(output_dir, "samples")
-    os.makedirs(sample_dir, exist_ok=True)
+    if write_csv:
+        os.makedirs(sample_dir, exist_ok=True)
 
+    backend = backend or renderers.RENDER_BACKEND
+    dpi = dpi or renderers.RENDER_DPI
+    extension = renderers.output_format(backend, fmt)
+
+    # Draw every sample up front so workers only render and write files
+    tasks = []
     for i in range(iterations):
-        male_sample, female_sample = generate_random_sample(df, used_ids, sample_size)
+        male_sample, female_sample = generate_random_sample(sampler, sample_size)
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        image_name = f"visual_{timestamp}_{i+1}.png"
-        image_path = os.path.join(output_dir, image_name)
-
-        plot_abstract_visualization(male_sample, female_sample, image_path)
-
-        male_sample.to_csv(os.path.join(sample_dir, f"sample_{i+1}_male.csv"), index=False)
-        female_sample.to_csv(os.path.join(sample_dir, f"sample_{i+1}_female.csv"), index=False)
+        tasks.append({
+            "index": i + 1,
+            "male_sample": male_sample,
+            "female_sample": female_sample,
+            "seed": int(jitter_seeds[i]),
+            "data_version": data_version,
+            "backend": backend,
+            "dpi": dpi,
+            "image_path": os.path.join(output_dir, f"visual_{timestamp}_{i+1}.{extension}"),
+            "male_csv": os.path.join(sample_dir, f"sample_{i+1}_male.csv"),
+            "female_csv": os.path.join(sample_dir, f"sample_{i+1}_female.csv"),
+            "write_csv": write_csv,
+        })
 
-        metadata = {
-            "visual_path": os.path.basename(image_path),
-            "description": f"Sample {i+1}",
-            "timestamp": datetime.datetime.now().isoformat()
-        }
-        metadata_list.append(metadata)
-        print(f"✅ Generated Sample {i+1} → {image_path}")
-
-    save_metadata_list(metadata_list)
+    metadata_list = []
+    manifests = []
+    try:
+        for task, (cache_hit, manifest, metadata) in zip(tasks, run_tasks(render_sample, tasks, workers)):
+            render_cache.record(cache_hit)
+            manifests.append(manifest)
+            metadata_list.append(metadata)
+            print(f"✅ Generated Sample {task['index']} → {task['image_path']}")
+            if on_progress is not None:
+                on_progress(task["index"], metadata)
+    finally:
+        # Also on cancellation, so every image already on disk can be rebuilt
+        save_manifests(manifests)
+
+    save_metadata_list(metadata_list, output_dir)
+
+@timed("generation")
+def main(sample_size, sample_count, seed=None, workers=None, on_progress=None, output_dir=None, source=None):
+    """Generate visuals into `output_dir`, or into the shared static folder (wiping it) if none is given.
+
+    source="table" samples from the full table snapshot; source="sql" draws each sample
+    from the clustered materialized view without loading the table. Defaults to
+    SAMPLE_SOURCE, read per call so a preloaded server picks up changes.
+    """
+    if source is None:
+        source = os.getenv("SAMPLE_SOURCE", "table")
+    if output_dir is None:
+        clean_static_folder()
+        output_dir = "static"
+
+    if source == "sql":
+        from database import engine
+        df = None
+        sampler = SqlSampler(engine, seed=np.random.SeedSequence(seed).spawn(2)[0])
+    else:
+        df = load_data()
+        sampler = None
 
-def main(sample_size, sample_count):
-    clean_static_folder()
-    df = load_data()
-    generate_multiple_samples(df, sample_size=sample_size, iterations=sample_count)
+    generate_multiple_samples(df, sample_size=sample_size, iterations=sample_count, seed=seed, workers=workers,
+                              on_progress=on_progress, output_dir=output_dir,
+                              data_version=get_table_version("cleaned_salary_data2"), sampler=sampler)
@@ -1,12 +1,19 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import (Flask, render_template, request, redirect, url_for, flash, session, jsonify, abort, send_file,
+                   g, Response)
 from sqlalchemy import text
 from sqlalchemy.orm import Session as DBSession
-from analysis import main as generate_images
-from models import UserResponse
-from database import engine
+from database import get_engine
+from jobs import enqueue_generation, get_job, cancel_job, resume_pending_jobs, FINISHED_STATES
+from outputs import start_gc_thread
+from responses import new_submission_id, valid_submission_id, rows_from_form, insert_responses
+from response_analytics import distribution, cluster_distributions
+from images import resolve as resolve_visual, file_digest, cache_lifetime, image_sources
+import metrics
 
 import json
 import os
+import time
+from contextlib import ExitStack
 
 app = Flask(__name__)
 app.secret_key = 'secret123'
@@ -20,7 +27,7 @@ def login():
     username = request.form['username']
     password = request.form['password']
 
-    with DBSession(bind=engine) as db:
+    with DBSession(bind=get_engine()) as db:
         query = text("SELECT * FROM users WHERE username = :u AND password = :p")
         user = db.execute(query, {"u": username, "p": password}).fetchone()
 
@@ -40,7 +47,7 @@ def register_form():
 def register():
     data = request.form
 
-    with DBSession(bind=engine) as db:
+    with DBSession(bind=get_engine()) as db:
         query_check = text("SELECT * FROM users WHERE username = :u OR email = :e")
         exists = db.execute(query_check, {"u": data['username'], "e": data['email']}).fetchone()
 
@@ -81,21 +88,50 @@ def generate_samples():
     sample_size = int(request.form['sample_size'])
     sample_count = int(request.form['num_samples'])
 
-    generate_images(sample_size, sample_count)
+    job_id = enqueue_generation(session['username'], sample_size, sample_count)
+    session['job_id'] = job_id
 
-    return redirect(url_for('view_images'))
+    return redirect(url_for('view_images', job=job_id))
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    if 'username' not in session:
+        abort(401)
+    job = get_job(job_id)
+    if job is None or job["username"] != session['username']:
+        abort(404)
+    job["images"] = [{**image, "sources": visual_sources(image)} for image in job["images"]]
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    if 'username' not in session:
+        abort(401)
+    job = cancel_job(job_id, session['username'])
+    if job is None:
+        abort(404)
+    return jsonify(job)
 
 @app.route('/view_images')
 def view_images():
-    visuals_path = os.path.join("static", "visuals.json")
-
-    if os.path.exists(visuals_path):
-        with open(visuals_path) as f:
-            images = json.load(f)
+    job_id = request.args.get('job') or session.get('job_id')
+    job = get_job(job_id) if job_id else None
+    if job is not None and job["username"] != session.get('username'):
+        job = None
+
+    if job is not None:
+        # Each job writes into its own namespace; the job record is the caller's manifest
+        images = job["images"]
     else:
-        images = []
+        visuals_path = os.path.join("static", "visuals.json")
+        if os.path.exists(visuals_path):
+            with open(visuals_path) as f:
+                images = json.load(f)
+        else:
+            images = []
 
-    return render_template("view_images.html", images=images)
+    return render_template("view_images.html", images=images, job=job, finished_states=FINISHED_STATES,
+                           submission_id=new_submission_id())
 
 @app.route('/submit_response', methods=['POST'])
 def submit_response():
@@ -105,31 +141,88 @@ def submit_response():
     username = session['username']
     form = request.form
 
-    responses = []
-    index = 0
-
-    while f'image_name_{index}' in form:
-        response = UserResponse(
-            username=username,
-            image_name=form[f'image_name_{index}'],
-            question1=form.get(f'question1_{index}'),
-            question2=form.get(f'question2_{index}'),
-            question3=form.get(f'question3_{index}')
-        )
-        responses.append(response)
-        index += 1
-
-    with DBSession(bind=engine) as db:
-        db.add_all(responses)
-        db.commit()
+    submission_id = valid_submission_id(form.get('submission_id'))
+    insert_responses(rows_from_form(form, username, submission_id))
 
     flash("All responses submitted!", "success")
     return redirect(url_for('thank_you'))
 
+@app.route('/analytics')
+def analytics():
+    """Answer distributions from the response rollups: ?image=, ?cluster= and/or ?question= narrow it down."""
+    if 'username' not in session:
+        abort(401)
+    image_name = request.args.get('image')
+    cluster = request.args.get('cluster')
+    question = request.args.get('question')
+    if image_name is not None or cluster is not None:
+        return jsonify({"image": image_name, "cluster": cluster,
+                        "questions": distribution(image_name, cluster, question)})
+    return jsonify({"overall": distribution(question=question), "clusters": cluster_distributions(question)})
+
+@app.route('/visuals/<path:visual_path>')
+def serve_visual(visual_path):
+    """A generated image (path relative to static/) with a content-hash ETag; handles
+    If-None-Match/If-Modified-Since and Range requests via send_file."""
+    path = resolve_visual(visual_path)
+    if path is None:
+        abort(404)
+    digest = file_digest(path)
+    max_age, immutable = cache_lifetime(request.args.get('v'), digest)
+    response = send_file(path, etag=digest, conditional=True, max_age=max_age)
+    response.cache_control.public = True
+    response.cache_control.immutable = immutable
+    return response
+
+@app.template_global()
+def visual_sources(image):
+    """src, srcset, sizes and full-size URLs for one image's metadata."""
+    return image_sources(image, lambda path, version: url_for('serve_visual', visual_path=path, v=version))
+
 @app.route('/thank_you')
 def thank_you():
     return render_template('thank_you.html')
 
 
+@app.before_request
+def start_background_work():
+    # Pick up jobs a previous worker left behind and start the output collector;
+    # both are no-ops after the first request
+    resume_pending_jobs()
+    start_gc_thread()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if metrics.PROFILE_REQUESTS and request.args.get('profile') == '1':
+        g.profile = ExitStack()
+        g.profile_path = g.profile.enter_context(metrics.profiled(f"request_{request.endpoint}"))
+
+@app.after_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None and request.endpoint != 'prometheus_metrics':
+        labels = {"endpoint": request.endpoint or "unmatched", "method": request.method}
+        metrics.observe("http_request_seconds", time.perf_counter() - started, **labels)
+        metrics.count("http_requests_total", status=response.status_code, **labels)
+    if g.get('profile_path'):
+        response.headers['X-Profile'] = g.profile_path
+    return response
+
+@app.teardown_request
+def finish_profile(exc):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.close()
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint; set METRICS_TOKEN to require `Authorization: Bearer <token>`."""
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        abort(401)
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
 if __name__ == '__main__':
     app.run(debug=True)
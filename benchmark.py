@@ -0,0 +1,300 @@
+# benchmark.py
+#
+# End-to-end benchmark of the ETL → cluster → render → survey pipeline on synthetic HR
+# data. Every stage runs in its own interpreter inside a scratch directory (its own
+# config/, static/, cache/ and logs/), against a scratch SQLite file or a dedicated
+# PostgreSQL database, and reports wall time, peak RSS and rows/images per second.
+#
+#   python benchmark.py --rows 10000 100000                 # SQLite, all stages
+#   python benchmark.py --database-url postgresql://...     # PostgreSQL stand-in (tables are replaced!)
+#   python benchmark.py --rows 1000000 --stages etl_stream cluster --baseline base.json
+#
+# Results go to --output as JSON; with --baseline every stage is compared against a
+# previous results file and the run fails when one got slower than --tolerance allows.
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import subprocess
+from datetime import datetime
+
+import yaml
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_SAMPLE = os.path.join(REPO_DIR, "data", "dataset2", "test.csv")
+# dataset2 column -> the name the pipeline config expects
+SOURCE_COLUMNS = {"Employee ID": "EmployeeID", "Years at Company": "TotalWorkingYears",
+                  "Job Role": "JobRole", "Monthly Income": "MonthlyIncome"}
+STAGES = ("etl", "etl_stream", "cluster", "render", "cluster_visuals", "survey")
+GENERATE_CHUNK_ROWS = 500_000
+# Stage metrics where higher is better; everything else is compared as "lower is better"
+THROUGHPUT_METRICS = ("rows_per_sec", "images_per_sec")
+
+
+# ---------------------------------------------------------------- synthetic data
+
+def generate_dataset(path, rows, seed=0):
+    """Write `rows` synthetic employees shaped like data/dataset2/test.csv.
+
+    Rows are resampled from the sample file with jittered numbers and unique ids, and
+    the columns the pipeline reads are renamed to the names in config.yaml.
+    """
+    import numpy as np
+    import pandas as pd
+
+    sample = pd.read_csv(SOURCE_SAMPLE).rename(columns=SOURCE_COLUMNS)
+    rng = np.random.default_rng(seed)
+    ids = rng.permutation(rows) + 100_000
+    tmp_path = f"{path}.tmp"
+    for start in range(0, rows, GENERATE_CHUNK_ROWS):
+        n = min(GENERATE_CHUNK_ROWS, rows - start)
+        chunk = sample.iloc[rng.integers(0, len(sample), n)].reset_index(drop=True)
+        chunk["EmployeeID"] = ids[start:start + n]
+        chunk["Age"] = np.clip(chunk["Age"].to_numpy() + rng.integers(-3, 4, n), 18, 65)
+        chunk["TotalWorkingYears"] = np.clip(chunk["TotalWorkingYears"].to_numpy() + rng.integers(-2, 3, n),
+                                             0, None)
+        chunk["MonthlyIncome"] = np.round(chunk["MonthlyIncome"].to_numpy() * rng.lognormal(0, 0.1, n)).astype(int)
+        chunk.to_csv(tmp_path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+    os.replace(tmp_path, path)
+
+
+def dataset_path(workdir, rows, seed):
+    path = os.path.join(workdir, "data", f"synthetic_{rows}_{seed}.csv")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        print(f"📂 Generating {rows} synthetic rows → {path}")
+        generate_dataset(path, rows, seed)
+    return path
+
+
+def write_config(run_dir, data_file):
+    """The repo's config with the dataset pointed at the synthetic file."""
+    with open(os.path.join(REPO_DIR, "config", "config.yaml")) as f:
+        config = yaml.safe_load(f)
+    config["dataset"].update(file_name=data_file, streaming=False, incremental=False)
+    os.makedirs(os.path.join(run_dir, "config"), exist_ok=True)
+    with open(os.path.join(run_dir, "config", "config.yaml"), "w") as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return config["dataset"]
+
+
+# ---------------------------------------------------------------- stages (run in the child)
+
+def stage_etl(options, streaming=False):
+    from sqlalchemy import text
+    from database import get_engine
+    from etl_pipeline import ETLPipeline
+
+    engine = get_engine(statement_timeout_ms=0)
+    pipeline = ETLPipeline(None, "config/config.yaml", engine=engine)
+    pipeline.run_pipeline(streaming=streaming, incremental=False)
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"SELECT COUNT(*) FROM {pipeline.config['table_name']}")).scalar()
+    return {"rows": rows}
+
+
+def stage_cluster(options):
+    from data_access import load_table
+    from cluster import cluster_and_export
+
+    df = load_table()
+    cluster_and_export(df, workers=options["workers"], binary=True)
+    return {"rows": len(df)}
+
+
+def stage_render(options):
+    from data_access import load_table, get_table_version
+    from analysis import generate_multiple_samples
+
+    generate_multiple_samples(load_table(), sample_size=7, iterations=options["images"], seed=0,
+                              workers=options["workers"], output_dir=os.path.join("static", "generated", "benchmark"),
+                              data_version=get_table_version())
+    return {"images": options["images"]}
+
+
+def stage_cluster_visuals(options):
+    from generate_cluster_visuals import main, discover_clusters
+
+    clusters = discover_clusters()
+    main(clusters=clusters, num_images=options["images"], workers=options["workers"])
+    return {"images": len(clusters) * options["images"]}
+
+
+def stage_survey(options):
+    from responses import new_submission_id, rows_from_form, insert_responses
+
+    stored = 0
+    for submission in range(options["submissions"]):
+        form = {}
+        for i in range(10):
+            form[f"image_name_{i}"] = f"generated/benchmark/visual_{(submission + i) % 50}.png"
+            for question in ("question1", "question2", "question3"):
+                form[f"{question}_{i}"] = "Yes" if (submission + i) % 3 else "No"
+        stored += len(insert_responses(rows_from_form(form, f"user{submission % 20}", new_submission_id())))
+    return {"rows": stored, "submissions": options["submissions"]}
+
+
+STAGE_FUNCTIONS = {
+    "etl": stage_etl,
+    "etl_stream": lambda options: stage_etl(options, streaming=True),
+    "cluster": stage_cluster,
+    "render": stage_render,
+    "cluster_visuals": stage_cluster_visuals,
+    "survey": stage_survey,
+}
+
+
+def run_stage(stage, options):
+    """Time one stage in this process; returns its metrics."""
+    from database import get_engine, Base
+    import models  # noqa: F401 -- registers the tables
+
+    Base.metadata.create_all(get_engine())
+    started = time.perf_counter()
+    result = STAGE_FUNCTIONS[stage](options)
+    seconds = time.perf_counter() - started
+    # ru_maxrss is in KiB on Linux; children covers in-process pool workers that exited
+    result.update(seconds=round(seconds, 3),
+                  peak_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                  children_peak_rss_mb=round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1))
+    if "rows" in result:
+        result["rows_per_sec"] = round(result["rows"] / seconds, 1) if seconds > 0 else None
+    if "images" in result:
+        result["images_per_sec"] = round(result["images"] / seconds, 3) if seconds > 0 else None
+    return result
+
+
+# ---------------------------------------------------------------- driver
+
+def stage_subprocess(stage, run_dir, database_url, options, verbose=False):
+    result_file = os.path.join(run_dir, f"{stage}.result.json")
+    env = {**os.environ, "DATABASE_URL": database_url, "PYTHONPATH": REPO_DIR, "MPLBACKEND": "Agg"}
+    command = [sys.executable, os.path.abspath(__file__), "--child-stage", stage,
+               "--child-options", json.dumps(options), "--child-result", result_file]
+    completed = subprocess.run(command, cwd=run_dir, env=env, text=True,
+                               stdout=None if verbose else subprocess.PIPE,
+                               stderr=None if verbose else subprocess.STDOUT)
+    if completed.returncode != 0:
+        if not verbose:
+            print(completed.stdout[-4000:])
+        raise RuntimeError(f"Stage {stage} failed with exit code {completed.returncode}")
+    with open(result_file) as f:
+        return json.load(f)
+
+
+def run_scale(rows, args):
+    """Fresh scratch directory (and SQLite file) per scale, then every stage in order."""
+    run_dir = os.path.join(os.path.abspath(args.workdir), f"run_{rows}")
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir)
+    data_file = dataset_path(os.path.abspath(args.workdir), rows, args.seed)
+    write_config(run_dir, data_file)
+    database_url = args.database_url or f"sqlite:///{os.path.join(run_dir, 'benchmark.sqlite')}"
+
+    options = {"workers": args.workers, "images": args.images, "submissions": args.submissions}
+    results = {}
+    for stage in args.stages:
+        print(f"⏱️  {rows} rows: {stage}...")
+        results[stage] = stage_subprocess(stage, run_dir, database_url, options, args.verbose)
+        print(f"   {format_metrics(results[stage])}")
+    return results
+
+
+def format_metrics(metrics):
+    parts = [f"{metrics['seconds']:.2f}s", f"peak RSS {metrics['peak_rss_mb']:.0f} MB"]
+    if metrics.get("rows_per_sec"):
+        parts.append(f"{metrics['rows_per_sec']:,.0f} rows/s")
+    if metrics.get("images_per_sec"):
+        parts.append(f"{metrics['images_per_sec']:.2f} images/s")
+    return ", ".join(parts)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Print per-stage changes against `baseline`; returns the list of regressions."""
+    regressions = []
+    for scale, stages in results["scales"].items():
+        for stage, metrics in stages.items():
+            base = baseline.get("scales", {}).get(scale, {}).get(stage)
+            if not base:
+                continue
+            for metric in ("seconds", "peak_rss_mb") + THROUGHPUT_METRICS:
+                if not metrics.get(metric) or not base.get(metric):
+                    continue
+                ratio = metrics[metric] / base[metric]
+                # Express every change as "how much worse", > 1 being a regression
+                worse = 1 / ratio if metric in THROUGHPUT_METRICS else ratio
+                flag = "❌" if worse > 1 + tolerance else "✅"
+                print(f"{flag} {scale:>9} {stage:<16} {metric:<15} {base[metric]:>12,.2f} → "
+                      f"{metrics[metric]:>12,.2f} ({(ratio - 1) * 100:+.1f}%)")
+                if worse > 1 + tolerance:
+                    regressions.append((scale, stage, metric))
+    return regressions
+
+
+def main(args):
+    results = {
+        "created_at": datetime.utcnow().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "backend": "postgresql" if args.database_url else "sqlite",
+        "options": {"workers": args.workers, "images": args.images, "submissions": args.submissions,
+                    "seed": args.seed},
+        "scales": {},
+    }
+    for rows in args.rows:
+        results["scales"][str(rows)] = run_scale(rows, args)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ETL, clustering, rendering and survey stages.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000], help="Dataset sizes to run (e.g. 10000 1000000)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--database-url", default=os.getenv("BENCHMARK_DATABASE_URL"),
+                        help="Dedicated PostgreSQL database (its tables are replaced); default: a scratch SQLite file")
+    parser.add_argument("--workers", type=int, default=1, help="Render/serialisation processes")
+    parser.add_argument("--images", type=int, default=10, help="Images per render stage (per cluster for cluster_visuals)")
+    parser.add_argument("--submissions", type=int, default=200, help="10-image survey submissions to store")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=os.path.join("cache", "benchmark"))
+    parser.add_argument("--output", default=os.path.join("cache", "benchmark", "results.json"))
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before failing (0.2 = 20%%)")
+    parser.add_argument("--verbose", action="store_true", help="Show the stages' own output")
+    parser.add_argument("--child-stage", help=argparse.SUPPRESS)
+    parser.add_argument("--child-options", help=argparse.SUPPRESS)
+    parser.add_argument("--child-result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_stage:
+        metrics = run_stage(args.child_stage, json.loads(args.child_options))
+        with open(args.child_result, "w") as f:
+            json.dump(metrics, f)
+    else:
+        sys.exit(main(args))
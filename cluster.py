@@ -1,8 +1,13 @@
 import os
-import pandas as pd
-import numpy as np
+import shutil
+import argparse
 import glob
-from database import engine  # assumes your SQLAlchemy engine is defined here
+from data_access import load_table, write_snapshot
+from render_pool import run_tasks
+from clustering import load_clustering_config, assign_clusters, publish_clusters
+from metrics import timed
+
+GENDER_FILES = {"Male": "male", "Female": "female"}
 
 def clean_static_folder():
     folders = ["static/clusters"]
@@ -10,42 +15,81 @@ def clean_static_folder():
         if not os.path.exists(folder):
             os.makedirs(folder)
         else:
-            for f in glob.glob(f"{folder}/*.csv"):
+            for f in glob.glob(f"{folder}/*.csv") + glob.glob(f"{folder}/clusters.json"):
                 os.remove(f)
+            for d in glob.glob(f"{folder}/*.npyd"):
+                shutil.rmtree(d, ignore_errors=True)
 
 def load_data_from_postgres():
-    table_name = "cleaned_salary_data2"
-    with engine.connect() as conn:
-        df = pd.read_sql(f"SELECT * FROM {table_name};", conn)
+    return load_table("cleaned_salary_data2")
+
+def label_clusters(df, config=None):
+    """Tag rows with ClusterID/Cluster using the dimensions from the `clustering` config."""
+    df, _ = assign_clusters(df, config or load_clustering_config())
     return df
 
-def cluster_and_export(df):
-    output_dir = "static/clusters"
-    os.makedirs(output_dir, exist_ok=True)
+def serialize_group(frame):
+    """CSV body (no header) of one (Cluster, Gender) group; runs in a pool worker when parallel."""
+    return frame.to_csv(index=False, header=False)
 
-    # Create AgeGroup and ExpGroup using medians
-    age_median = df['Age'].median()
-    exp_median = df['TotalWorkingYears'].median()
+@timed("cluster_and_export")
+def cluster_and_export(df, output_dir="static/clusters", workers=1, binary=False, config=None):
+    """Write <cluster>_combined/_male/_female.csv, serializing every row exactly once.
 
-    df['AgeGroup'] = df['Age'].apply(lambda x: 'High' if x >= age_median else 'Low')
-    df['ExpGroup'] = df['TotalWorkingYears'].apply(lambda x: 'High' if x >= exp_median else 'Low')
-    df['Cluster'] = df['AgeGroup'] + '_' + df['ExpGroup']
+    Each (Cluster, Gender) group is rendered to CSV once and that text is written both to
+    its gender file and into the cluster's combined file, so combined files list rows
+    grouped by gender. With binary=True a memory-mappable column snapshot (see
+    data_access.write_snapshot) is written next to each CSV as <name>.npyd/. The list of
+    non-empty clusters is published to <output_dir>/clusters.json.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    config = config or load_clustering_config()
+    with timed("clustering", strategy=config.get("strategy", "quantile")):
+        df = label_clusters(df, config)
+
+    header = df.head(0).to_csv(index=False)
+    groups = [(cluster, gender, frame) for (cluster, gender), frame
+              in df.groupby(['Cluster', 'Gender'], observed=True, sort=True)]
+    bodies = run_tasks(serialize_group, [frame for _, _, frame in groups], workers)
 
-    for cluster_name, cluster_df in df.groupby('Cluster'):
-        # Save combined cluster
-        cluster_path = os.path.join(output_dir, f"{cluster_name}_combined.csv")
-        cluster_df.to_csv(cluster_path, index=False)
+    combined = {}
+    written = set()
+    for (cluster, gender, frame), body in zip(groups, bodies):
+        combined.setdefault(cluster, []).append(body)
+        if gender in GENDER_FILES:
+            name = f"{cluster}_{GENDER_FILES[gender]}"
+            with open(os.path.join(output_dir, f"{name}.csv"), "w") as f:
+                f.write(header)
+                f.write(body)
+            if binary:
+                write_snapshot(frame, os.path.join(output_dir, f"{name}.npyd"))
+            written.add(name)
 
-        # Save male and female separately
-        male_df = cluster_df[cluster_df['Gender'] == 'Male']
-        female_df = cluster_df[cluster_df['Gender'] == 'Female']
+    for cluster, cluster_bodies in combined.items():
+        with open(os.path.join(output_dir, f"{cluster}_combined.csv"), "w") as f:
+            f.write(header)
+            f.writelines(cluster_bodies)
+        if binary:
+            write_snapshot(df[df['Cluster'] == cluster], os.path.join(output_dir, f"{cluster}_combined.npyd"))
 
-        male_df.to_csv(os.path.join(output_dir, f"{cluster_name}_male.csv"), index=False)
-        female_df.to_csv(os.path.join(output_dir, f"{cluster_name}_female.csv"), index=False)
+        # A cluster with no rows of one gender still gets its (header-only) file
+        for suffix in GENDER_FILES.values():
+            name = f"{cluster}_{suffix}"
+            if name not in written:
+                with open(os.path.join(output_dir, f"{name}.csv"), "w") as f:
+                    f.write(header)
+                if binary:
+                    write_snapshot(df.head(0), os.path.join(output_dir, f"{name}.npyd"))
 
-    print(f"Clustered data saved to: {output_dir}")
+    clusters = publish_clusters(df, config, os.path.join(output_dir, "clusters.json"))
+    print(f"Clustered data saved to: {output_dir} ({len(clusters)} clusters)")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split the cleaned data into the clusters configured in config.yaml.")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to serialize CSV groups")
+    parser.add_argument("--binary", action="store_true", help="Also write memory-mappable .npyd snapshots")
+    args = parser.parse_args()
+
     clean_static_folder()
     df = load_data_from_postgres()
-    cluster_and_export(df)
+    cluster_and_export(df, workers=args.workers, binary=args.binary)
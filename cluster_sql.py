@@ -0,0 +1,166 @@
+# cluster_sql.py
+#
+# Median-split clustering computed inside PostgreSQL. The cleaned table is exposed as a
+# materialized view with `cluster` ("High_Low", ...), `gender` and a random `sample_key`
+# column, indexed so each sampled row is one index probe instead of a full-table
+# transfer into pandas. The ETL rebuilds the view whenever it reloads the table.
+#
+# The view name comes from `cluster_view` in config/config.yaml, for the ETL and the
+# samplers alike.
+import os
+import functools
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from metrics import timed
+
+DEFAULT_CLUSTER_VIEW = "cleaned_salary_clusters"
+# Rounds of random index probes per draw before falling back to a range scan
+PROBE_ROUNDS = 4
+
+
+@functools.lru_cache(maxsize=None)
+def configured_view(config_file="config/config.yaml"):
+    """The `cluster_view` named in the dataset config."""
+    if not os.path.exists(config_file):
+        return DEFAULT_CLUSTER_VIEW
+    import yaml
+
+    with open(config_file) as f:
+        dataset = yaml.safe_load(f).get("dataset", {})
+    return dataset.get("cluster_view") or DEFAULT_CLUSTER_VIEW
+
+
+def create_cluster_view(conn, table_name="cleaned_salary_data2", view=None):
+    """(Re)create the clustered materialized view over `table_name` on an open connection."""
+    view = view or configured_view()
+    conn.exec_driver_sql(f"DROP MATERIALIZED VIEW IF EXISTS {view}")
+    conn.exec_driver_sql(f"""
+        CREATE MATERIALIZED VIEW {view} AS
+        SELECT t.*,
+               (CASE WHEN t."Age" >= m.age_median THEN 'High' ELSE 'Low' END) || '_' ||
+               (CASE WHEN t."TotalWorkingYears" >= m.exp_median THEN 'High' ELSE 'Low' END) AS cluster,
+               t."Gender" AS gender,
+               random() AS sample_key
+        FROM {table_name} t
+        CROSS JOIN (
+            SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY "Age") AS age_median,
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY "TotalWorkingYears") AS exp_median
+            FROM {table_name}
+        ) m
+    """)
+    conn.exec_driver_sql(f"CREATE INDEX {view}_cluster_gender_idx ON {view} (cluster, gender, sample_key)")
+    conn.exec_driver_sql(f"CREATE INDEX {view}_gender_idx ON {view} (gender, sample_key)")
+    conn.exec_driver_sql(f"ANALYZE {view}")
+
+
+def refresh_cluster_view(conn, view=None):
+    """Recompute medians and clusters after in-place changes to the base table.
+
+    A refresh also re-rolls every `sample_key`.
+    """
+    view = view or configured_view()
+    exists = conn.execute(text("SELECT to_regclass(:v) IS NOT NULL"), {"v": view}).scalar()
+    if exists:
+        conn.exec_driver_sql(f"REFRESH MATERIALIZED VIEW {view}")
+    return exists
+
+
+def cluster_names(engine, view=None):
+    view = view or configured_view()
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(text(f"SELECT DISTINCT cluster FROM {view} ORDER BY cluster"))]
+
+
+class SqlSampler:
+    """Draws employees straight from the view, with the EmployeeSampler draw/draw_pair interface.
+
+    Every row of a draw comes from its own random point on `sample_key`: the first
+    matching row at or after the point, skipping employees this sampler has already
+    returned. Rows are therefore independent of each other, but not exactly uniform: a
+    row's chance is proportional to the gap below its key, and the keys only change
+    when the view is rebuilt or refreshed. If the probes keep missing (a nearly
+    exhausted group), the rest is read as one contiguous range from a random point.
+    Pass `cluster` to restrict every draw to one cluster.
+    """
+
+    def __init__(self, engine, seed=None, cluster=None, view=None):
+        self.engine = engine
+        self.view = view or configured_view()
+        self.cluster = cluster
+        self.rng = np.random.default_rng(seed)
+        self.used_ids = []
+
+    def _filters(self, gender, exclude):
+        where = ["gender = :gender", "NOT (\"EmployeeID\" = ANY(:used))"]
+        params = {"gender": gender, "used": exclude}
+        if self.cluster is not None:
+            where.append("cluster = :cluster")
+            params["cluster"] = self.cluster
+        return where, params
+
+    def _probe(self, conn, gender, points, exclude):
+        """One row per point: the first match at or after it (points past the last key find nothing)."""
+        where, params = self._filters(gender, exclude)
+        sql = f"""
+            SELECT v.* FROM unnest(CAST(:points AS double precision[])) AS p(point)
+            CROSS JOIN LATERAL (
+                SELECT * FROM {self.view} WHERE {' AND '.join(where)} AND sample_key >= p.point
+                ORDER BY sample_key LIMIT 1
+            ) v
+        """
+        with timed("db_read", query="cluster_sample"):
+            return pd.read_sql(text(sql), conn, params={**params, "points": [float(p) for p in points]})
+
+    def _query(self, conn, gender, n, start, wrapped, exclude):
+        where, params = self._filters(gender, exclude)
+        where.append("sample_key < :start" if wrapped else "sample_key >= :start")
+        sql = f"SELECT * FROM {self.view} WHERE {' AND '.join(where)} ORDER BY sample_key LIMIT :n"
+        with timed("db_read", query="cluster_sample"):
+            return pd.read_sql(text(sql), conn, params={**params, "start": start, "n": n})
+
+    def _draw(self, gender, n):
+        frames = []
+        exclude = list(self.used_ids)
+        missing = n
+        with self.engine.connect() as conn:
+            for _ in range(PROBE_ROUNDS):
+                # Twice the points needed, since two points can land in the same gap
+                found = self._probe(conn, gender, self.rng.random(2 * missing), exclude)
+                found = found.drop_duplicates("EmployeeID").head(missing)
+                if found.empty:
+                    break
+                frames.append(found)
+                exclude.extend(int(i) for i in found["EmployeeID"])
+                missing -= len(found)
+                if missing == 0:
+                    break
+            if missing:
+                start = float(self.rng.random())
+                for wrapped in (False, True):
+                    found = self._query(conn, gender, missing, start, wrapped, exclude)
+                    if found.empty:
+                        continue
+                    frames.append(found)
+                    exclude.extend(int(i) for i in found["EmployeeID"])
+                    missing -= len(found)
+                    if missing == 0:
+                        break
+        if missing:
+            raise ValueError("Not enough unique samples left.")
+        frame = pd.concat(frames, ignore_index=True)
+        return frame.drop(columns=["cluster", "gender", "sample_key"])
+
+    def draw_frame(self, gender, n):
+        frame = self._draw(gender, n)
+        self.used_ids.extend(int(i) for i in frame["EmployeeID"])
+        return frame
+
+    def draw_pair(self, first_group, second_group, n):
+        """Draw `n` employees from each group; nothing is marked used unless both draws succeed."""
+        first = self._draw(first_group, n)
+        second = self._draw(second_group, n)
+        self.used_ids.extend(int(i) for i in pd.concat([first["EmployeeID"], second["EmployeeID"]]))
+        return first, second
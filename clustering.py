@@ -0,0 +1,112 @@
+# clustering.py
+#
+# Config-driven clustering engine. Dimensions and binning strategy come from the
+# `clustering` section of config/config.yaml; every row gets a compact integer ClusterID
+# plus a readable Cluster name, and the resulting cluster list is published to
+# static/clusters/clusters.json for generate_cluster_visuals to discover.
+import os
+import json
+
+import yaml
+import numpy as np
+import pandas as pd
+
+CLUSTER_LIST_PATH = os.path.join("static", "clusters", "clusters.json")
+
+# The original fixed 2x2 median split on Age and TotalWorkingYears
+DEFAULT_CLUSTERING = {
+    "strategy": "quantile",
+    "dimensions": [
+        {"column": "Age", "bins": 2, "labels": ["Low", "High"], "group_column": "AgeGroup"},
+        {"column": "TotalWorkingYears", "bins": 2, "labels": ["Low", "High"], "group_column": "ExpGroup"},
+    ],
+}
+
+
+def load_clustering_config(config_file="config/config.yaml"):
+    if not os.path.exists(config_file):
+        return DEFAULT_CLUSTERING
+    with open(config_file) as f:
+        dataset = yaml.safe_load(f).get("dataset", {})
+    return dataset.get("clustering") or DEFAULT_CLUSTERING
+
+
+def dimension_codes(values, dimension):
+    """Bin codes and labels for one dimension: quantile bins for numbers, one bin per value otherwise."""
+    if dimension.get("type") == "category" or not pd.api.types.is_numeric_dtype(values):
+        categorical = pd.Categorical(values)
+        return categorical.codes.astype(np.int16), [str(c) for c in categorical.categories]
+
+    bins = int(dimension.get("bins", 2))
+    edges = np.quantile(values.to_numpy(dtype=float), np.linspace(0, 1, bins + 1)[1:-1])
+    # side="right": a value equal to an edge goes to the upper bin, as with `>= median`
+    codes = np.searchsorted(edges, values.to_numpy(dtype=float), side="right").astype(np.int16)
+    labels = dimension.get("labels") or [f"Q{i + 1}" for i in range(bins)]
+    return codes, labels
+
+
+def _quantile_clusters(df, config):
+    cluster_ids = np.zeros(len(df), dtype=np.int32)
+    names = [""]
+    group_columns = {}
+    for dimension in config["dimensions"]:
+        codes, labels = dimension_codes(df[dimension["column"]], dimension)
+        # Mixed-radix id: earlier dimensions are the more significant digits
+        cluster_ids = cluster_ids * len(labels) + codes
+        names = [f"{prefix}_{label}" if prefix else label for prefix in names for label in labels]
+        if dimension.get("group_column"):
+            group_columns[dimension["group_column"]] = pd.Categorical.from_codes(codes, categories=labels)
+    return cluster_ids, names, group_columns
+
+
+def _kmeans_clusters(df, config):
+    from sklearn.cluster import MiniBatchKMeans
+
+    kmeans = config.get("kmeans", {})
+    columns = kmeans.get("columns") or [d["column"] for d in config.get("dimensions", [])]
+    features = df[columns].to_numpy(dtype=float)
+    # Standardize so no single column dominates the distance
+    features = (features - features.mean(axis=0)) / np.where(features.std(axis=0) > 0, features.std(axis=0), 1)
+
+    model = MiniBatchKMeans(n_clusters=int(kmeans.get("k", 4)), batch_size=int(kmeans.get("batch_size", 4096)),
+                            random_state=kmeans.get("random_state", 0), n_init="auto")
+    cluster_ids = model.fit_predict(features)
+    names = [f"Cluster_{i + 1}" for i in range(model.n_clusters)]
+    return cluster_ids, names, {}
+
+
+def assign_clusters(df, config=None):
+    """Add ClusterID (int16), Cluster (categorical name) and any per-dimension group columns."""
+    config = config or DEFAULT_CLUSTERING
+    strategy = config.get("strategy", "quantile")
+    if strategy == "quantile":
+        cluster_ids, names, group_columns = _quantile_clusters(df, config)
+    elif strategy == "kmeans":
+        cluster_ids, names, group_columns = _kmeans_clusters(df, config)
+    else:
+        raise ValueError(f"Unknown clustering strategy: {strategy}")
+
+    for column, values in group_columns.items():
+        df[column] = values
+    df["ClusterID"] = cluster_ids.astype(np.int16)
+    df["Cluster"] = pd.Categorical.from_codes(cluster_ids, categories=names)
+    return df, names
+
+
+def publish_clusters(df, config, path=CLUSTER_LIST_PATH):
+    """Write the non-empty clusters (id, name, size) so consumers need no hard-coded names."""
+    counts = df["Cluster"].value_counts(sort=False)
+    clusters = [{"id": int(i), "name": name, "rows": int(counts[name])}
+                for i, name in enumerate(df["Cluster"].cat.categories) if counts[name] > 0]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"strategy": config.get("strategy", "quantile"), "clusters": clusters}, f, indent=2)
+    return clusters
+
+
+def load_cluster_list(path=CLUSTER_LIST_PATH):
+    """Names of the published clusters, or None if clustering has not been run."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return [cluster["name"] for cluster in json.load(f)["clusters"]]
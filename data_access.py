@@ -0,0 +1,169 @@
+# data_access.py
+#
+# Shared read path for the cleaned salary table. The table is materialised once per
+# table version into a local column snapshot (.npy per column) that is memory-mapped on
+# read, so web workers and scripts stop re-parsing the whole table through pd.read_sql.
+import os
+import json
+import uuid
+import time
+import shutil
+import hashlib
+import threading
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import inspect, text
+
+from metrics import timed
+
+DEFAULT_TABLE = "cleaned_salary_data2"
+VERSION_TABLE = "etl_table_versions"
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join("cache", "snapshots"))
+# How long a worker trusts its last version check before asking the database again
+VERSION_CHECK_INTERVAL = float(os.getenv("SNAPSHOT_VERSION_TTL", "30"))
+
+_version_cache = {}
+_version_lock = threading.Lock()
+
+
+def bump_table_version(conn, table_name):
+    """Record a new version for `table_name`; call inside the transaction that changed it."""
+    conn.exec_driver_sql(f"""
+        CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            version TEXT NOT NULL,
+            updated_at TIMESTAMP NOT NULL
+        )
+    """)
+    version = uuid.uuid4().hex
+    conn.execute(text(f"DELETE FROM {VERSION_TABLE} WHERE table_name = :t"), {"t": table_name})
+    conn.execute(text(f"INSERT INTO {VERSION_TABLE} (table_name, version, updated_at) VALUES (:t, :v, :at)"),
+                 {"t": table_name, "v": version, "at": datetime.utcnow()})
+    return version
+
+
+def _default_engine(engine):
+    if engine is not None:
+        return engine
+    from database import engine as default_engine
+    return default_engine
+
+
+def _engine_key(engine):
+    """Stable directory name per database so two databases never share snapshots."""
+    url = engine.url.render_as_string(hide_password=True)
+    return hashlib.sha1(url.encode()).hexdigest()[:12]
+
+
+def get_table_version(table_name=DEFAULT_TABLE, engine=None, max_age=None):
+    """Current version of `table_name`, re-checked at most every `max_age` seconds."""
+    engine = _default_engine(engine)
+    max_age = VERSION_CHECK_INTERVAL if max_age is None else max_age
+    cache_key = (_engine_key(engine), table_name)
+
+    with _version_lock:
+        cached = _version_cache.get(cache_key)
+        if cached and time.monotonic() - cached[1] < max_age:
+            return cached[0]
+
+    with engine.connect() as conn:
+        if inspect(conn).has_table(VERSION_TABLE):
+            version = conn.execute(text(f"SELECT version FROM {VERSION_TABLE} WHERE table_name = :t"),
+                                   {"t": table_name}).scalar()
+        else:
+            version = None
+
+    with _version_lock:
+        _version_cache[cache_key] = (version, time.monotonic())
+    return version
+
+
+@timed("file_write", target="snapshot")
+def write_snapshot(df, path):
+    """Write `df` as one .npy file per column plus a meta.json describing how to rebuild it."""
+    os.makedirs(path, exist_ok=True)
+    columns = []
+    for i, col in enumerate(df.columns):
+        file_name = f"col_{i}.npy"
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(path, file_name), series.to_numpy())
+            columns.append({"name": col, "file": file_name, "kind": "numeric"})
+        else:
+            categorical = series.astype("category")
+            np.save(os.path.join(path, file_name), categorical.cat.codes.to_numpy())
+            columns.append({"name": col, "file": file_name, "kind": "categorical",
+                            "categories": categorical.cat.categories.tolist()})
+
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"rows": len(df), "columns": columns}, f)
+
+
+def read_snapshot(path):
+    """Memory-map a snapshot written by write_snapshot; no column data is copied."""
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+
+    data = {}
+    for column in meta["columns"]:
+        values = np.load(os.path.join(path, column["file"]), mmap_mode="r")
+        if column["kind"] == "categorical":
+            values = pd.Categorical.from_codes(values, categories=column["categories"])
+        data[column["name"]] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def _materialize(engine, table_name, version, path):
+    """Dump the table into `path`; concurrent workers race on an atomic rename."""
+    print(f"📦 Materializing snapshot of {table_name} (version {version})...")
+    with engine.connect() as conn, timed("db_read", query="snapshot"):
+        df = pd.read_sql(f"SELECT * FROM {table_name};", conn)
+
+    tmp_path = f"{path}.tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    write_snapshot(df, tmp_path)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Another worker published the same version first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    # Older versions are no longer reachable; mapped files stay valid until unmapped
+    parent = os.path.dirname(path)
+    for entry in os.listdir(parent):
+        if entry != version and ".tmp-" not in entry:
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+
+@lru_cache(maxsize=4)
+def _load_snapshot(engine, table_name, version):
+    path = os.path.join(SNAPSHOT_DIR, _engine_key(engine), table_name, version)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        _materialize(engine, table_name, version, path)
+    return read_snapshot(path)
+
+
+@timed("load_table")
+def load_table(table_name=DEFAULT_TABLE, engine=None):
+    """Return the table as a DataFrame, served from the local snapshot when it is current.
+
+    Tables without a recorded version (never loaded by the ETL since versioning was added)
+    are read straight from the database, as a snapshot of them could never be refreshed.
+    """
+    engine = _default_engine(engine)
+    version = get_table_version(table_name, engine)
+    if version is None:
+        with engine.connect() as conn, timed("db_read", query="table"):
+            return pd.read_sql(f"SELECT * FROM {table_name};", conn)
+
+    # Shallow copy: callers may add columns without touching the cached frame
+    return _load_snapshot(engine, table_name, version).copy(deep=False)
+
+
+def invalidate():
+    """Forget cached versions and frames, e.g. right after running the ETL in-process."""
+    with _version_lock:
+        _version_cache.clear()
+    _load_snapshot.cache_clear()
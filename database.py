@@ -1,12 +1,124 @@
 # database.py
 import os
-from sqlalchemy import create_engine
+import time
+import threading
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from dotenv import load_dotenv
 
 load_dotenv()  # ⬅️ Load environment variables from .env file
 
+# Pool settings, shared by the web app and every script
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds; stay under server/proxy idle limits
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 = no limit (PostgreSQL only)
+
+_engines = {}
+_engines_lock = threading.Lock()
+_pool_counters = {}  # engine name -> (engine, counters)
+
+
+def database_url():
+    """DATABASE_URL, or a URL assembled from the DB_USER/DB_PASSWORD/DB_HOST/DB_PORT/DB_NAME variables."""
+    if os.getenv("DATABASE_URL"):
+        return os.getenv("DATABASE_URL")
+    if not os.getenv("DB_NAME"):
+        return None
+    return URL.create("postgresql", username=os.getenv("DB_USER"), password=os.getenv("DB_PASSWORD"),
+                      host=os.getenv("DB_HOST"), port=int(os.getenv("DB_PORT") or 5432),
+                      database=os.getenv("DB_NAME"))
+
+
+def _track_pool(engine, name):
+    """Count connects/checkouts and time how long connections are held, per engine."""
+    counters = {"connects": 0, "checkouts": 0, "checkins": 0, "invalidations": 0, "held_seconds": 0.0}
+    _pool_counters[name] = (engine, counters)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, record):
+        counters["connects"] += 1
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, record, proxy):
+        counters["checkouts"] += 1
+        record.info["checked_out_at"] = time.perf_counter()
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, record):
+        counters["checkins"] += 1
+        started = record.info.pop("checked_out_at", None)
+        if started is not None:
+            counters["held_seconds"] += time.perf_counter() - started
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, record, exception):
+        counters["invalidations"] += 1
+
+
+def get_engine(url=None, statement_timeout_ms=None, **options):
+    """Shared engine for `url` (default: database_url()), created once per process.
+
+    Engines come with pool_pre_ping and the DB_POOL_* settings; on PostgreSQL every
+    connection also gets `statement_timeout` (DB_STATEMENT_TIMEOUT_MS unless overridden,
+    0 disables it). Extra keyword arguments are passed to create_engine.
+    """
+    url = make_url(url or database_url())
+    timeout = STATEMENT_TIMEOUT_MS if statement_timeout_ms is None else statement_timeout_ms
+    key = (url.render_as_string(hide_password=False), timeout, tuple(sorted(options.items())))
+
+    with _engines_lock:
+        if key in _engines:
+            return _engines[key]
+
+        kwargs = {"pool_pre_ping": True, "pool_recycle": POOL_RECYCLE}
+        if url.get_backend_name() != "sqlite":
+            kwargs.update(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT)
+        if url.get_backend_name() == "postgresql" and timeout:
+            kwargs["connect_args"] = {"options": f"-c statement_timeout={int(timeout)}"}
+        kwargs.update(options)
+
+        new_engine = create_engine(url, **kwargs)
+        _track_pool(new_engine, f"{url.render_as_string(hide_password=True)}#{len(_engines)}")
+        _engines[key] = new_engine
+        return new_engine
+
+
+def pool_stats():
+    """Current pool occupancy and lifetime counters for every engine in this process."""
+    stats = {}
+    for name, (pool_engine, counters) in list(_pool_counters.items()):
+        pool = pool_engine.pool
+        stats[name] = {
+            **counters,
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+        }
+    return stats
+
+
+def _dispose_after_fork():
+    # A forked child (gunicorn worker, multiprocessing) must never reuse the parent's
+    # sockets; close=False leaves them open for the parent and just forgets them here.
+    for pool_engine in list(_engines.values()):
+        pool_engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_after_fork)
+
+
+def __getattr__(name):
+    # `database.engine` / `from database import engine` build the engine (and load the
+    # driver) on first use, so importing models or the web app never touches the database
+    if name == "engine":
+        return get_engine() if database_url() else None
+    if name == "db_url":
+        return database_url()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-db_url = os.getenv("DATABASE_URL")  # should NOT be None
-engine = create_engine(db_url)
 Base = declarative_base()
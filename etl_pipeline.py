@@ -1,9 +1,22 @@
 import yaml
+import numpy as np
 import pandas as pd
 import psycopg2
-from sqlalchemy import create_engine
+from sqlalchemy import inspect, text, BigInteger, Float, Text
+from sqlalchemy.engine import URL
 import logging
 import os
+import io
+import time
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from data_access import bump_table_version
+from database import get_engine
+from cluster_sql import create_cluster_view, refresh_cluster_view
+from metrics import timed, count
+
+WATERMARK_TABLE = "etl_watermarks"
 
 # Logging setup
 log_file = "logs/etl_log.log"
@@ -13,17 +26,20 @@ logging.basicConfig(filename=log_file, level=logging.INFO,
 
 
 class ETLPipeline:
-    def __init__(self, db_config, config_file):
-        """Initialize database connection and load config."""
+    def __init__(self, db_config, config_file, engine=None):
+        """Initialize database connection and load config; `engine` overrides db_config."""
         self.db_config = db_config
-        self.engine = create_engine(
-            f"postgresql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
-        )
+        # Bulk loads and view rebuilds can legitimately run long, so no statement timeout here
+        self.engine = engine or get_engine(URL.create(
+            "postgresql", username=db_config['user'], password=db_config['password'],
+            host=db_config['host'], port=db_config['port'], database=db_config['database']
+        ), statement_timeout_ms=0)
 
         # Load YAML config file
         with open(config_file, "r") as file:
             self.config = yaml.safe_load(file)["dataset"]
 
+    @timed("etl", stage="extract")
     def extract(self):
         """Load dataset from CSV or Excel file based on configuration."""
         file_path = self.config["file_name"]
@@ -49,6 +65,7 @@ class ETLPipeline:
             logging.error(f"Error in Extraction: {e}")
             return None
 
+    @timed("etl", stage="transform")
     def transform(self, df):
         """Clean and filter data based on attributes in config."""
         print("🛠 Transforming data...")
@@ -72,6 +89,199 @@ class ETLPipeline:
         logging.info(f"Transformed Data: {df.shape[0]} rows, {df.shape[1]} columns")
         return df
 
+    def extract_chunks(self):
+        """Yield the dataset in chunks, projected to the configured attributes at read time."""
+        file_path = self.config["file_name"]
+        sheet_name = self.config.get("sheet_name", None)
+        attributes = self.config["attributes"]
+        chunk_size = int(self.config.get("chunk_size", 100000))
+        dtypes = self.config.get("dtypes", None)
+
+        print(f"📂 Streaming data from {file_path} in chunks of {chunk_size} rows...")
+        logging.info(f"Streaming data from {file_path} (chunk_size={chunk_size})")
+
+        if file_path.endswith('.csv'):
+            reader = pd.read_csv(file_path, usecols=attributes, dtype=dtypes, chunksize=chunk_size)
+            while True:
+                with timed("etl", stage="extract_chunk"):
+                    chunk = next(reader, None)
+                if chunk is None:
+                    break
+                yield chunk[attributes]
+        elif file_path.endswith(('.xlsx', '.xls')):
+            # openpyxl cannot stream through pandas, so only the projection bounds memory here
+            df = pd.read_excel(file_path, sheet_name=sheet_name, usecols=attributes,
+                               dtype=dtypes, engine='openpyxl')
+            for start in range(0, len(df), chunk_size):
+                yield df.iloc[start:start + chunk_size][attributes]
+        else:
+            raise ValueError("❌ Unsupported file format. Only CSV and Excel files are supported.")
+
+    @staticmethod
+    def chunk_schema(chunk):
+        """Numeric dtypes every chunk of a stream is cast to, pinned from the first raw chunk.
+
+        Left alone, pandas infers dtypes per chunk: an int column turns float64 in any chunk
+        where it has a blank, and the same row would then hash differently across chunks.
+        """
+        schema = {}
+        for col in chunk.columns:
+            if pd.api.types.is_integer_dtype(chunk[col]):
+                schema[col] = "Int64"
+            elif pd.api.types.is_float_dtype(chunk[col]):
+                schema[col] = "float64"
+        return schema
+
+    @staticmethod
+    def conform_chunk(chunk, schema):
+        """Cast a chunk's numeric columns to the pinned stream schema."""
+        for col, dtype in schema.items():
+            try:
+                # Nullable Int64 refuses to truncate non-integral floats instead of silently rounding
+                chunk[col] = chunk[col].astype(dtype)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Column {col} does not fit the {dtype} type inferred from the first chunk "
+                                 f"({e}); set its type under 'dtypes' in the dataset config.") from e
+        return chunk
+
+    @timed("etl", stage="transform_chunk")
+    def transform_chunk(self, chunk, seen_hashes, schema):
+        """Clean one chunk and drop rows already seen in earlier chunks.
+
+        `seen_hashes` is a sorted uint64 array of row hashes; the updated array is returned
+        alongside the cleaned chunk so duplicates are removed across the whole file.
+        `schema` comes from chunk_schema, so every chunk is hashed with the same dtypes.
+        """
+        chunk = self.conform_chunk(chunk.dropna(), schema)
+
+        # Trim before dedup so rows that only differ by whitespace collapse together
+        for col in chunk.select_dtypes(include=['object', 'string']).columns:
+            chunk[col] = chunk[col].str.strip()
+
+        chunk = chunk.drop_duplicates()
+
+        hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        positions = np.searchsorted(seen_hashes, hashes)
+        already_seen = np.zeros(len(hashes), dtype=bool)
+        in_range = positions < len(seen_hashes)
+        already_seen[in_range] = seen_hashes[positions[in_range]] == hashes[in_range]
+
+        chunk = chunk[~already_seen]
+        # Merge the sorted new hashes in rather than re-sorting everything seen so far
+        new_hashes = np.unique(hashes[~already_seen])
+        seen_hashes = np.insert(seen_hashes, np.searchsorted(seen_hashes, new_hashes), new_hashes)
+
+        return self.compact_dtypes(chunk), seen_hashes
+
+    @staticmethod
+    def compact_dtypes(df):
+        """Downcast numeric columns and store repeated strings as categories."""
+        df = df.copy()
+        for col in df.columns:
+            if pd.api.types.is_integer_dtype(df[col]):
+                df[col] = pd.to_numeric(df[col], downcast="integer")
+            elif pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col]):
+                df[col] = df[col].astype("category")
+        return df
+
+    @staticmethod
+    def sql_dtypes(df):
+        """SQL column types that do not depend on how far a chunk happened to be downcast."""
+        types = {}
+        for col in df.columns:
+            if pd.api.types.is_integer_dtype(df[col]):
+                types[col] = BigInteger()
+            elif pd.api.types.is_float_dtype(df[col]):
+                types[col] = Float(precision=53)
+            elif not pd.api.types.is_bool_dtype(df[col]):
+                types[col] = Text()
+        return types
+
+    @staticmethod
+    def cast_to_sql_types(df, types):
+        """Cast numeric columns to match their SQL types, so COPY never sends "30.0" to a BIGINT."""
+        casts = {}
+        for col, sql_type in types.items():
+            if isinstance(sql_type, BigInteger) and not pd.api.types.is_integer_dtype(df[col]):
+                casts[col] = "Int64"
+            elif isinstance(sql_type, Float) and not pd.api.types.is_float_dtype(df[col]):
+                casts[col] = "float64"
+        return df.astype(casts) if casts else df
+
+    def staging_table(self, table_name):
+        return f"{table_name}__staging"
+
+    def create_staging(self, table_name, df, dtype=None):
+        """Create an empty staging table with the schema of `df` (or the SQL types in `dtype`)."""
+        staging = self.staging_table(table_name)
+        df.head(0).to_sql(staging, self.engine, if_exists='replace', index=False,
+                          dtype=dtype or self.sql_dtypes(df))
+        return staging
+
+    def drop_staging(self, staging):
+        """Drop a half-loaded staging table so the next run starts clean."""
+        quote = self.engine.dialect.identifier_preparer.quote
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {quote(staging)}")
+
+    @timed("etl", stage="write_rows")
+    def write_rows(self, table_name, df, copy_batch_rows=100000, dtype=None):
+        """Append rows to `table_name`, via COPY FROM STDIN on PostgreSQL and to_sql elsewhere.
+
+        `dtype` is the table's SQL types; the rows are cast to them before serialising.
+        """
+        if dtype:
+            df = self.cast_to_sql_types(df, dtype)
+        if self.engine.dialect.name != "postgresql" or self.engine.dialect.driver != "psycopg2":
+            df.to_sql(table_name, self.engine, if_exists='append', index=False)
+            return
+
+        quote = self.engine.dialect.identifier_preparer.quote
+        columns = ", ".join(quote(col) for col in df.columns)
+        copy_sql = f"COPY {quote(table_name)} ({columns}) FROM STDIN WITH (FORMAT csv)"
+
+        conn = self.engine.raw_connection()
+        try:
+            cur = conn.cursor()
+            # Serialise in slices so the CSV buffer stays small even for huge frames
+            for start in range(0, len(df), copy_batch_rows):
+                buffer = io.StringIO()
+                df.iloc[start:start + copy_batch_rows].to_csv(buffer, index=False, header=False)
+                buffer.seek(0)
+                cur.copy_expert(copy_sql, buffer)
+            conn.commit()
+            cur.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def cluster_view(self):
+        """Name of the clustered materialized view to maintain, if configured (PostgreSQL only)."""
+        if self.engine.dialect.name != "postgresql":
+            return None
+        return self.config.get("cluster_view")
+
+    @timed("etl", stage="swap_in")
+    def swap_in(self, staging, table_name):
+        """Atomically replace `table_name` with the fully loaded staging table."""
+        quote = self.engine.dialect.identifier_preparer.quote
+        cluster_view = self.cluster_view()
+        with self.engine.begin() as conn:
+            if cluster_view:
+                conn.exec_driver_sql(f"DROP MATERIALIZED VIEW IF EXISTS {cluster_view}")
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {quote(table_name)}")
+            conn.exec_driver_sql(f"ALTER TABLE {quote(staging)} RENAME TO {quote(table_name)}")
+            if cluster_view:
+                # Same transaction, so readers go straight from the old view to the new one
+                create_cluster_view(conn, table_name, cluster_view)
+            # A full replace invalidates any incremental watermark for this table
+            if inspect(conn).has_table(WATERMARK_TABLE):
+                conn.execute(text(f"DELETE FROM {WATERMARK_TABLE} WHERE table_name = :t"), {"t": table_name})
+            bump_table_version(conn, table_name)
+
+    @timed("etl", stage="load")
     def load(self, df):
         """Load transformed data into PostgreSQL."""
         table_name = self.config["table_name"]
@@ -79,13 +289,187 @@ class ETLPipeline:
         print(f"📡 Loading data into PostgreSQL table: {table_name}...")
         logging.info(f"Loading data into {table_name}")
 
-        df.to_sql(table_name, self.engine, if_exists='replace', index=False)
+        start = time.perf_counter()
+        staging = self.create_staging(table_name, df)
+        try:
+            self.write_rows(staging, df)
+            self.swap_in(staging, table_name)
+        except Exception:
+            self.drop_staging(staging)
+            raise
+        elapsed = time.perf_counter() - start
+        count("etl_rows_loaded_total", len(df), table=table_name)
 
+        rate = len(df) / elapsed if elapsed > 0 else float("inf")
         print(f"✅ Data successfully loaded into {table_name}")
-        logging.info(f"Data successfully loaded into {table_name}")
+        logging.info(f"Data successfully loaded into {table_name}: {len(df)} rows in {elapsed:.2f}s "
+                     f"({rate:.0f} rows/sec)")
+
+    @staticmethod
+    def fingerprint_source(file_path, block_size=1 << 20):
+        """Size, mtime and SHA-256 of the source file."""
+        stat = os.stat(file_path)
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as file:
+            for block in iter(lambda: file.read(block_size), b""):
+                digest.update(block)
+        return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": digest.hexdigest()}
+
+    def read_watermark(self, table_name):
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(f"""
+                CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+                    table_name TEXT PRIMARY KEY,
+                    source_file TEXT NOT NULL,
+                    source_size BIGINT NOT NULL,
+                    source_mtime DOUBLE PRECISION NOT NULL,
+                    source_sha256 TEXT NOT NULL,
+                    row_count BIGINT NOT NULL,
+                    rows_upserted BIGINT NOT NULL,
+                    rows_deleted BIGINT NOT NULL,
+                    loaded_at TIMESTAMP NOT NULL
+                )
+            """)
+            row = conn.execute(text(f"SELECT * FROM {WATERMARK_TABLE} WHERE table_name = :t"),
+                               {"t": table_name}).mappings().fetchone()
+        return dict(row) if row else None
 
-    def run_pipeline(self):
+    def write_watermark(self, table_name, fingerprint, row_count, rows_upserted, rows_deleted):
+        with self.engine.begin() as conn:
+            conn.execute(text(f"DELETE FROM {WATERMARK_TABLE} WHERE table_name = :t"), {"t": table_name})
+            conn.execute(text(f"""
+                INSERT INTO {WATERMARK_TABLE} (table_name, source_file, source_size, source_mtime, source_sha256,
+                                              row_count, rows_upserted, rows_deleted, loaded_at)
+                VALUES (:t, :f, :size, :mtime, :sha, :rows, :upserted, :deleted, :at)
+            """), {"t": table_name, "f": self.config["file_name"], "size": fingerprint["size"],
+                   "mtime": fingerprint["mtime"], "sha": fingerprint["sha256"], "rows": row_count,
+                   "upserted": rows_upserted, "deleted": rows_deleted, "at": datetime.now(timezone.utc)})
+
+    @staticmethod
+    def row_hashes(df, key):
+        """Per-row hash indexed by key, normalised so DB and file reads of the same value agree."""
+        normalised = pd.DataFrame(index=df.index)
+        for col in df.columns:
+            if pd.api.types.is_numeric_dtype(df[col]):
+                normalised[col] = df[col].astype("float64")
+            else:
+                normalised[col] = df[col].astype(str)
+        hashes = pd.util.hash_pandas_object(normalised, index=False)
+        return pd.Series(hashes.to_numpy(), index=df[key].to_numpy())
+
+    @timed("etl", stage="upsert")
+    def upsert(self, table_name, df, key):
+        """INSERT ... ON CONFLICT (key) DO UPDATE the rows of `df` into `table_name`."""
+        quote = self.engine.dialect.identifier_preparer.quote
+        staging = self.create_staging(table_name, df)
+        self.write_rows(staging, df)
+
+        columns = ", ".join(quote(col) for col in df.columns)
+        updates = ", ".join(f"{quote(col)} = EXCLUDED.{quote(col)}" for col in df.columns if col != key)
+        with self.engine.begin() as conn:
+            # WHERE true keeps SQLite from parsing ON CONFLICT as part of the SELECT
+            conn.exec_driver_sql(f"""
+                INSERT INTO {quote(table_name)} ({columns})
+                SELECT {columns} FROM {quote(staging)} WHERE true
+                ON CONFLICT ({quote(key)}) DO UPDATE SET {updates}
+            """)
+            conn.exec_driver_sql(f"DROP TABLE {quote(staging)}")
+
+    @timed("etl", stage="delete_keys")
+    def delete_keys(self, table_name, keys, key):
+        quote = self.engine.dialect.identifier_preparer.quote
+        staging = self.create_staging(table_name, keys)
+        self.write_rows(staging, keys)
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(f"DELETE FROM {quote(table_name)} "
+                                 f"WHERE {quote(key)} IN (SELECT {quote(key)} FROM {quote(staging)})")
+            conn.exec_driver_sql(f"DROP TABLE {quote(staging)}")
+
+    def ensure_key_index(self, table_name, key):
+        quote = self.engine.dialect.identifier_preparer.quote
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(f"CREATE UNIQUE INDEX IF NOT EXISTS {quote(f'{table_name}_{key}_key')} "
+                                 f"ON {quote(table_name)} ({quote(key)})")
+
+    def run_incremental_pipeline(self):
+        """Skip unchanged sources; otherwise upsert only new/changed rows and delete removed keys."""
+        table_name = self.config["table_name"]
+        key = self.config.get("key_column", "EmployeeID")
+        print("🚀 Starting incremental ETL Pipeline...")
+        logging.info("Starting incremental ETL Pipeline...")
+
+        start = time.perf_counter()
+        watermark = self.read_watermark(table_name)
+        stat = os.stat(self.config["file_name"])
+        if watermark and watermark["source_size"] == stat.st_size and watermark["source_mtime"] == stat.st_mtime:
+            print(f"✅ Source unchanged since {watermark['loaded_at']}, nothing to do.")
+            logging.info(f"Incremental ETL skipped: source size/mtime unchanged for {table_name}")
+            return
+
+        fingerprint = self.fingerprint_source(self.config["file_name"])
+        if watermark and watermark["source_sha256"] == fingerprint["sha256"]:
+            self.write_watermark(table_name, fingerprint, watermark["row_count"], 0, 0)
+            print(f"✅ Source content unchanged since {watermark['loaded_at']}, nothing to do.")
+            logging.info(f"Incremental ETL skipped: source content hash unchanged for {table_name}")
+            return
+
+        df = self.extract()
+        if df is None:
+            print("❌ Extraction failed. Terminating pipeline.")
+            logging.error("Extraction failed. Terminating pipeline.")
+            return
+        df = self.transform(df).drop_duplicates(subset=[key], keep="last")
+
+        if watermark is None:
+            # No incremental history yet: one full load establishes the keyed table
+            self.load(df)
+            self.ensure_key_index(table_name, key)
+            self.write_watermark(table_name, fingerprint, len(df), len(df), 0)
+            print(f"✅ Initial incremental load: {len(df)} rows into {table_name}")
+            logging.info(f"Initial incremental load: {len(df)} rows into {table_name}")
+            return
+
+        with self.engine.connect() as conn:
+            existing = pd.read_sql(f"SELECT * FROM {self.engine.dialect.identifier_preparer.quote(table_name)}",
+                                   conn)
+        new_hashes = self.row_hashes(df, key)
+        old_hashes = self.row_hashes(existing[df.columns], key)
+
+        changed = ~new_hashes.index.isin(old_hashes.index)
+        common = ~changed
+        changed[common] = new_hashes[common].to_numpy() != old_hashes.reindex(new_hashes.index[common]).to_numpy()
+        upserts = df[changed]
+        removed = existing.loc[~existing[key].isin(df[key]), [key]]
+
+        if len(upserts):
+            self.upsert(table_name, upserts, key)
+        if len(removed):
+            self.delete_keys(table_name, removed, key)
+        if len(upserts) or len(removed):
+            with self.engine.begin() as conn:
+                bump_table_version(conn, table_name)
+                if self.cluster_view():
+                    refresh_cluster_view(conn, self.cluster_view())
+        self.write_watermark(table_name, fingerprint, len(df), len(upserts), len(removed))
+
+        elapsed = time.perf_counter() - start
+        count("etl_rows_upserted_total", len(upserts), table=table_name)
+        count("etl_rows_deleted_total", len(removed), table=table_name)
+        print(f"✅ Incremental ETL completed: {len(upserts)} rows upserted, {len(removed)} removed")
+        logging.info(f"Incremental ETL completed for {table_name}: {len(upserts)} upserted, "
+                     f"{len(removed)} removed, {len(df)} total rows in {elapsed:.2f}s")
+
+    def run_pipeline(self, streaming=None, incremental=None):
         """Run ETL pipeline for the specified dataset."""
+        if incremental is None:
+            incremental = self.config.get("incremental", False)
+        if incremental:
+            return self.run_incremental_pipeline()
+        if streaming is None:
+            streaming = self.config.get("streaming", False)
+        if streaming:
+            return self.run_streaming_pipeline()
+
         print("🚀 Starting ETL Pipeline...")
         logging.info("Starting ETL Pipeline...")
 
@@ -105,12 +489,57 @@ class ETLPipeline:
         print("✅ ETL pipeline completed successfully!")
         logging.info("ETL pipeline completed successfully!")
 
+    def run_streaming_pipeline(self):
+        """Run ETL chunk by chunk so peak memory is bounded by chunk_size, not file size."""
+        table_name = self.config["table_name"]
+        print("🚀 Starting streaming ETL Pipeline...")
+        logging.info("Starting streaming ETL Pipeline...")
+
+        seen_hashes = np.empty(0, dtype=np.uint64)
+        schema = None
+        sql_types = None
+        staging = None
+        total_rows = 0
+        chunks = 0
+        start = time.perf_counter()
+
+        try:
+            for chunk in self.extract_chunks():
+                if schema is None:
+                    schema = self.chunk_schema(chunk)
+                chunk, seen_hashes = self.transform_chunk(chunk, seen_hashes, schema)
+                if staging is None:
+                    # The first chunk fixes the staging schema; later chunks are cast to it
+                    sql_types = self.sql_dtypes(chunk)
+                    staging = self.create_staging(table_name, chunk, dtype=sql_types)
+                self.write_rows(staging, chunk, dtype=sql_types)
+                chunks += 1
+                total_rows += len(chunk)
+                count("etl_rows_loaded_total", len(chunk), table=table_name)
+                logging.info(f"Loaded chunk {chunks}: {len(chunk)} rows ({total_rows} total)")
+
+            if staging is None:
+                raise ValueError("Source file contained no rows.")
+            self.swap_in(staging, table_name)
+        except Exception as e:
+            print(f"❌ Error in streaming ETL: {e}")
+            logging.error(f"Error in streaming ETL: {e}")
+            if staging is not None:
+                self.drop_staging(staging)
+            raise
+
+        elapsed = time.perf_counter() - start
+        rate = total_rows / elapsed if elapsed > 0 else float("inf")
+        print(f"✅ Streaming ETL completed: {total_rows} rows in {chunks} chunks loaded into {table_name}")
+        logging.info(f"Streaming ETL completed: {total_rows} rows in {chunks} chunks loaded into {table_name} "
+                     f"in {elapsed:.2f}s ({rate:.0f} rows/sec)")
+
 
 db_config = {
     'user': os.getenv('DB_USER'),
     'password': os.getenv('DB_PASSWORD'),
     'host': os.getenv('DB_HOST'),
-    'port': int(os.getenv('DB_PORT')),
+    'port': int(os.getenv('DB_PORT') or 5432),
     'database': os.getenv('DB_NAME')
 }
 
@@ -118,5 +547,11 @@ db_config = {
 
 # Run the pipeline
 if __name__ == "__main__":
-    pipeline = ETLPipeline(db_config, "config/config.yaml")
-    pipeline.run_pipeline()
+    parser = argparse.ArgumentParser(description="Run the ETL pipeline.")
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--stream", action="store_true", help="Extract, transform and load in chunks")
+    parser.add_argument("--incremental", action="store_true", help="Upsert only new or changed rows")
+    args = parser.parse_args()
+
+    pipeline = ETLPipeline(db_config, args.config)
+    pipeline.run_pipeline(streaming=args.stream or None, incremental=args.incremental or None)
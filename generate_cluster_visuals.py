@@ -1,10 +1,20 @@
 import os
 import json
+import argparse
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # headless: never pick a GUI backend in web workers or batch runs
 import matplotlib.pyplot as plt
-from database import engine  # Make sure you have this
+from data_access import load_table, read_snapshot, get_table_version
+from manifests import manifest_entry, save_manifests, WRITE_SAMPLE_CSVS
+from render_pool import run_tasks, DEFAULT_WORKERS
+from cluster_sql import SqlSampler, cluster_names
+from clustering import load_cluster_list
+import render_cache
+from metrics import timed
 
+# Fallback when cluster.py has not published static/clusters/clusters.json
 CLUSTERS = ["High_High", "High_Low", "Low_High", "Low_Low"]
 ROOT_DIR = "static"
 VISUALS_DIR = os.path.join(ROOT_DIR, "visuals")
@@ -13,10 +23,10 @@ CLUSTERS_DIR = os.path.join(ROOT_DIR, "clusters")
 metadata = {}
 
 # Create necessary folders
-os.makedirs(SAMPLES_DIR, exist_ok=True)
 os.makedirs(VISUALS_DIR, exist_ok=True)
 
-def plot_side_by_side(male_df, female_df, image_path, scale_factor=1, min_size=400, title_suffix=""):
+@timed("render", kind="side_by_side")
+def plot_side_by_side(male_df, female_df, image_path, scale_factor=1, min_size=400, title_suffix="", seed=None):
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(18, 9), sharey=True)
     plt.subplots_adjust(wspace=0.2)
 
@@ -26,8 +36,9 @@ def plot_side_by_side(male_df, female_df, image_path, scale_factor=1, min_size=4
     male_sizes = np.maximum(male_df["MonthlyIncome"] * scale_factor, min_size)
     female_sizes = np.maximum(female_df["MonthlyIncome"] * scale_factor, min_size)
 
-    jitter_y_male = np.random.uniform(-0.3, 0.3, size=len(male_df))
-    jitter_y_female = np.random.uniform(-0.3, 0.3, size=len(female_df))
+    rng = np.random.default_rng(seed)
+    jitter_y_male = rng.uniform(-0.3, 0.3, size=len(male_df))
+    jitter_y_female = rng.uniform(-0.3, 0.3, size=len(female_df))
 
     y_min = min(male_df["Age"].min(), female_df["Age"].min()) - 3
     y_max = max(male_df["Age"].max(), female_df["Age"].max()) + 3
@@ -82,54 +93,137 @@ def plot_side_by_side(male_df, female_df, image_path, scale_factor=1, min_size=4
     plt.savefig(image_path, bbox_inches='tight', pad_inches=0.2, dpi=300)
     plt.close()
 
-def generate_images_per_cluster(cluster_name, num_images=10, sample_size=10):
-    male_file = os.path.join(CLUSTERS_DIR, f"{cluster_name}_male.csv")
-    female_file = os.path.join(CLUSTERS_DIR, f"{cluster_name}_female.csv")
+def cached_plot_side_by_side(male_df, female_df, image_path, seed, **plot_kwargs):
+    """plot_side_by_side through the render cache; returns the frames in plotted order and the hit flag."""
+    male_df = male_df.sort_values("EmployeeID", kind="stable")
+    female_df = female_df.sort_values("EmployeeID", kind="stable")
 
-    df_male = pd.read_csv(male_file)
-    df_female = pd.read_csv(female_file)
+    params = {"style": "side_by_side", "figsize": [18, 9], "dpi": 300, "revision": 1, **plot_kwargs}
+    key = render_cache.render_key(male_df, female_df, seed, params)
+    hit = render_cache.cached_render(
+        key, image_path, lambda path: plot_side_by_side(male_df, female_df, path, seed=seed, **plot_kwargs)
+    )
+    return male_df, female_df, hit
+
+_frame_cache = {}
+
+def load_cluster_frames(cluster_name):
+    """Male/female frames of one cluster export, read once per process.
+
+    Prefers the memory-mapped .npyd snapshots written by `cluster.py --binary` and falls
+    back to the CSVs.
+    """
+    if cluster_name not in _frame_cache:
+        frames = []
+        for suffix in ("male", "female"):
+            snapshot = os.path.join(CLUSTERS_DIR, f"{cluster_name}_{suffix}.npyd")
+            if os.path.isdir(snapshot):
+                frames.append(read_snapshot(snapshot))
+            else:
+                frames.append(pd.read_csv(os.path.join(CLUSTERS_DIR, f"{cluster_name}_{suffix}.csv")))
+        _frame_cache[cluster_name] = tuple(frames)
+    return _frame_cache[cluster_name]
+
+def render_cluster_image(task):
+    """Render visual `i` of a cluster; runs in a pool worker when parallel.
+
+    Returns (metadata key, metadata entry, manifest, cache hit), or None when the cluster
+    lacks one of the genders. The parent merges the entries into visuals.json and stores
+    the manifests; the sample CSV is only written when asked for.
+    """
+    cluster_name, i, sample_size, source, data_version, write_csv = task
+    with timed("sampling", kind="cluster", source=source):
+        if source == "sql":
+            from database import engine
+            sampler = SqlSampler(engine, seed=i, cluster=cluster_name)
+            sample_male, sample_female = sampler.draw_pair("Male", "Female", sample_size)
+        else:
+            df_male, df_female = load_cluster_frames(cluster_name)
+            if df_male.empty or df_female.empty:
+                return None
+            sample_male = df_male.sample(n=sample_size, replace=True, random_state=i)
+            sample_female = df_female.sample(n=sample_size, replace=True, random_state=i+100)
 
     cluster_folder = os.path.join(VISUALS_DIR, cluster_name)
     os.makedirs(cluster_folder, exist_ok=True)
+    image_path = os.path.join(cluster_folder, f"visual_{i}.png")
+    sample_male, sample_female, hit = cached_plot_side_by_side(sample_male, sample_female, image_path, seed=i)
 
-    for i in range(1, num_images + 1):
-        sample_male = df_male.sample(n=sample_size, replace=True, random_state=i)
-        sample_female = df_female.sample(n=sample_size, replace=True, random_state=i+100)
+    manifest = manifest_entry(f"visuals/{cluster_name}/visual_{i}.png", "side_by_side",
+                              sample_male, sample_female, seed=i, data_version=data_version)
 
+    if write_csv:
         sample_male["Group"] = "Red"
         sample_female["Group"] = "Blue"
 
         combined = pd.concat([sample_male, sample_female], ignore_index=True)
         sample_filename = f"{cluster_name}_{i}"
 
-        combined.to_csv(os.path.join(SAMPLES_DIR, f"{sample_filename}.csv"), index=False)
+        os.makedirs(SAMPLES_DIR, exist_ok=True)
+        with timed("file_write", target="sample_csv"):
+            combined.to_csv(os.path.join(SAMPLES_DIR, f"{sample_filename}.csv"), index=False)
 
-        image_path = os.path.join(cluster_folder, f"visual_{i}.png")
-        plot_side_by_side(sample_male, sample_female, image_path)
+    return f"{cluster_name}/visual_{i}.png", {
+        "cluster": cluster_name,
+        "male_ids": sample_male['EmployeeID'].tolist(),
+        "female_ids": sample_female['EmployeeID'].tolist()
+    }, manifest, hit
 
-        metadata[f"{cluster_name}/visual_{i}.png"] = {
-            "cluster": cluster_name,
-            "male_ids": sample_male['EmployeeID'].tolist(),
-            "female_ids": sample_female['EmployeeID'].tolist()
-        }
+def render_cluster_images(clusters, num_images=10, sample_size=10, source="csv", workers=1, write_csv=None):
+    """Fan (cluster, image) tasks out over the render pool and merge the results into `metadata`."""
+    write_csv = WRITE_SAMPLE_CSVS if write_csv is None else write_csv
+    data_version = get_table_version("cleaned_salary_data2")
+    tasks = [(cluster, i, sample_size, source, data_version, write_csv)
+             for cluster in clusters for i in range(1, num_images + 1)]
+    skipped = set()
+    manifests = []
+    try:
+        for task, result in zip(tasks, run_tasks(render_cluster_image, tasks, workers)):
+            if result is None:
+                skipped.add(task[0])
+                continue
+            key, entry, manifest, hit = result
+            render_cache.record(hit)
+            metadata[key] = entry
+            manifests.append(manifest)
+    finally:
+        save_manifests(manifests)
+    for cluster in sorted(skipped):
+        print(f"⚠️ Skipped {cluster}: it has no rows for one of the genders")
+
+def generate_images_per_cluster(cluster_name, num_images=10, sample_size=10, source="csv", write_csv=None):
+    """Render `num_images` visuals for one cluster in-process.
+
+    source="csv" samples (with replacement) from the static/clusters exports; source="sql"
+    samples directly from the clustered materialized view (see cluster_sql), so the
+    cluster CSVs are not needed at all.
+    """
+    render_cluster_images([cluster_name], num_images, sample_size, source, workers=1, write_csv=write_csv)
 
 # ✅ NEW FUNCTION — replaces merged plot with 100 male + 100 female full dataset sample
-def generate_full_sample_plot():
-    with engine.connect() as conn:
-        df = pd.read_sql("SELECT * FROM cleaned_salary_data2", conn)
+def generate_full_sample_plot(write_csv=None):
+    write_csv = WRITE_SAMPLE_CSVS if write_csv is None else write_csv
+    df = load_table("cleaned_salary_data2")
 
     df_male = df[df["Gender"] == "Male"].sample(n=100, random_state=999)
     df_female = df[df["Gender"] == "Female"].sample(n=100, random_state=888)
 
-    df_male["Group"] = "Red"
-    df_female["Group"] = "Blue"
-    combined = pd.concat([df_male, df_female])
+    image_path = os.path.join(VISUALS_DIR, "visual_final_100_male_100_female.png")
+    df_male, df_female, hit = cached_plot_side_by_side(df_male, df_female, image_path, seed=999,
+                                                       scale_factor=0.1, min_size=10)
+    render_cache.record(hit)
+    save_manifests([manifest_entry("visuals/visual_final_100_male_100_female.png", "side_by_side",
+                                   df_male, df_female, seed=999, params={"scale_factor": 0.1, "min_size": 10},
+                                   data_version=get_table_version("cleaned_salary_data2"))])
 
-    sample_csv = os.path.join(SAMPLES_DIR, "final_100_100_sample.csv")
-    combined.to_csv(sample_csv, index=False)
+    if write_csv:
+        df_male["Group"] = "Red"
+        df_female["Group"] = "Blue"
+        combined = pd.concat([df_male, df_female])
 
-    image_path = os.path.join(VISUALS_DIR, "visual_final_100_male_100_female.png")
-    plot_side_by_side(df_male, df_female, image_path, scale_factor=0.1, min_size=10)
+        os.makedirs(SAMPLES_DIR, exist_ok=True)
+        sample_csv = os.path.join(SAMPLES_DIR, "final_100_100_sample.csv")
+        combined.to_csv(sample_csv, index=False)
 
     metadata["visual_final_100_male_100_female.png"] = {
         "type": "final_100_each",
@@ -137,16 +231,44 @@ def generate_full_sample_plot():
         "female_ids": df_female["EmployeeID"].tolist()
     }
 
-def main():
-    for cluster in CLUSTERS:
-        generate_images_per_cluster(cluster_name=cluster)
+def discover_clusters(source="csv"):
+    """Cluster names published by cluster.py (or present in the SQL view), else the legacy four."""
+    if source == "sql":
+        from database import engine
+        return cluster_names(engine) or CLUSTERS
+    return load_cluster_list(os.path.join(CLUSTERS_DIR, "clusters.json")) or CLUSTERS
+
+def main(source=os.getenv("CLUSTER_SOURCE", "csv"), clusters=None, num_images=10, sample_size=10, workers=1,
+         write_csv=None):
+    visuals_file = os.path.join(ROOT_DIR, "visuals.json")
+    if clusters and os.path.exists(visuals_file):
+        # Re-rendering a subset keeps the other clusters' entries
+        with open(visuals_file) as f:
+            existing = json.load(f)
+        if isinstance(existing, dict):  # analysis.py writes a list to the same file
+            metadata.update(existing)
+    clusters = clusters or discover_clusters(source)
+    render_cluster_images(clusters, num_images, sample_size, source, workers, write_csv)
 
-    generate_full_sample_plot()
+    generate_full_sample_plot(write_csv)
 
-    with open(os.path.join(ROOT_DIR, "visuals.json"), "w") as f:
+    with open(visuals_file, "w") as f:
         json.dump(metadata, f, indent=2)
 
-    print("✅ Cluster graphs and full dataset sample graph generated!")
+    cache_stats = render_cache.stats()
+    print(f"✅ Cluster graphs and full dataset sample graph generated! "
+          f"(render cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses)")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Render the per-cluster red/blue visuals and visuals.json.")
+    parser.add_argument("--clusters", nargs="+", help="Clusters to render (default: every published cluster)")
+    parser.add_argument("--num-images", type=int, default=10, help="Visuals per cluster")
+    parser.add_argument("--sample-size", type=int, default=10, help="Employees per gender in each visual")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Render processes (1 = in-process)")
+    parser.add_argument("--source", choices=["csv", "sql"], default=os.getenv("CLUSTER_SOURCE", "csv"))
+    parser.add_argument("--write-csv", action="store_true", default=WRITE_SAMPLE_CSVS,
+                        help="Also write a sample CSV per visual (manifests are always stored)")
+    args = parser.parse_args()
+
+    main(source=args.source, clusters=args.clusters, num_images=args.num_images,
+         sample_size=args.sample_size, workers=args.workers, write_csv=args.write_csv)
@@ -0,0 +1,27 @@
+# gunicorn.conf.py
+#
+# Read automatically by `gunicorn app:app`. The app is imported once in the master
+# (preload_app) and workers are forked from it, so a new or restarted worker is ready
+# without re-importing Flask and SQLAlchemy. The analysis stack (numpy, pandas,
+# matplotlib) is still only imported by the first generation job; list modules in
+# GUNICORN_PRELOAD_MODULES (e.g. "analysis") to import them in the master instead and
+# share them between workers.
+import os
+import importlib
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+PRELOAD_MODULES = [name.strip() for name in os.getenv("GUNICORN_PRELOAD_MODULES", "").split(",") if name.strip()]
+
+
+def when_ready(server):
+    # Runs in the master before the first worker is forked
+    if not preload_app:
+        return
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+        server.log.info("Preloaded %s", name)
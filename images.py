@@ -0,0 +1,168 @@
+# images.py
+#
+# Serving side of the generated visuals. Every raster visual gets downscaled WebP
+# copies (visual_x.w480.webp, ...) when it is rendered, pages reference them through
+# `srcset`, and /visuals/<path> serves any of them with a strong content-hash ETag.
+# URLs carry ?v=<hash>, so a browser may keep a versioned image for a year and only
+# revalidates unversioned ones.
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+from metrics import timed
+
+STATIC_ROOT = "static"
+THUMBNAIL_WIDTHS = sorted({int(w) for w in os.getenv("THUMBNAIL_WIDTHS", "480,960,1600").split(",") if w.strip()})
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "webp")
+RASTER_EXTENSIONS = (".png", ".webp", ".jpg", ".jpeg")
+SERVED_EXTENSIONS = RASTER_EXTENSIONS + (".svg",)
+VERSIONED_MAX_AGE = int(os.getenv("IMAGE_MAX_AGE", str(365 * 24 * 3600)))
+UNVERSIONED_MAX_AGE = int(os.getenv("IMAGE_REVALIDATE_AGE", "300"))
+# <img sizes>: the page column is at most 700px wide
+IMAGE_SIZES = "(max-width: 740px) 100vw, 700px"
+
+_digests = OrderedDict()  # path -> ((inode, size, mtime_ns), digest)
+_digests_lock = threading.Lock()
+_DIGEST_CACHE_SIZE = 4096
+
+
+def file_digest(path):
+    """sha256 of the file's bytes, recomputed only when its inode, size or mtime change."""
+    stat = os.stat(path)
+    signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        cached = _digests.get(path)
+        if cached is not None and cached[0] == signature:
+            _digests.move_to_end(path)
+            return cached[1]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    value = digest.hexdigest()
+
+    with _digests_lock:
+        _digests[path] = (signature, value)
+        _digests.move_to_end(path)
+        while len(_digests) > _DIGEST_CACHE_SIZE:
+            _digests.popitem(last=False)
+    return value
+
+
+def thumbnail_path(image_path, width):
+    stem, _ = os.path.splitext(image_path)
+    return f"{stem}.w{width}.{THUMBNAIL_FORMAT}"
+
+
+def _save_downscaled(source, path, width):
+    from PIL import Image
+
+    height = max(1, round(source.height * width / source.width))
+    image = source.resize((width, height), Image.LANCZOS)
+    options = {"quality": 82, "method": 6} if THUMBNAIL_FORMAT == "webp" else {"optimize": True}
+    image.save(path, format=THUMBNAIL_FORMAT.upper(), **options)
+    return image
+
+
+def write_thumbnails(image_path, key=None, widths=THUMBNAIL_WIDTHS):
+    """Downscaled copies of a raster visual next to it; returns [(width, path)], widest first.
+
+    With a render-cache `key` each copy goes through the render cache too, so a cache
+    hit on the visual also reuses its thumbnails instead of resizing again. Widths at or
+    above the visual's own are skipped, since srcset must list the width actually served.
+    SVGs are left alone: they are already small and scale by themselves.
+    """
+    if not image_path.lower().endswith(RASTER_EXTENSIONS):
+        return []
+    import render_cache
+    from PIL import Image
+
+    with Image.open(image_path) as original:
+        source_width = original.width  # only the header is read here
+
+    state = {"source": None}
+
+    def downscale(path, width):
+        # Each width is resized from the next wider one, so the full image is decoded once
+        if state["source"] is None:
+            with Image.open(image_path) as original:
+                state["source"] = original.convert("RGBA" if original.mode in ("RGBA", "LA", "P") else "RGB")
+        state["source"] = _save_downscaled(state["source"], path, width)
+
+    thumbnails = []
+    with timed("thumbnails"):
+        for width in sorted((w for w in widths if w < source_width), reverse=True):
+            path = thumbnail_path(image_path, width)
+            if key is None:
+                downscale(path, width)
+            else:
+                render_cache.cached_render(f"{key}-w{width}", path, lambda tmp, width=width: downscale(tmp, width))
+            thumbnails.append((width, path))
+    return thumbnails
+
+
+def static_relative(path):
+    return os.path.relpath(path, STATIC_ROOT).replace(os.sep, "/")
+
+
+def _version(path):
+    return file_digest(path)[:16]
+
+
+def _thumbnail_entry(width, path):
+    return {"width": width, "path": static_relative(path), "version": _version(path)}
+
+
+def image_metadata(image_path, thumbnails):
+    """Fields stored with a visual's metadata: content version and thumbnail paths (relative to static/)."""
+    return {
+        "version": _version(image_path),
+        "thumbnails": [_thumbnail_entry(width, path) for width, path in thumbnails],
+    }
+
+
+def resolve(visual_path):
+    """Absolute file path for a visual relative to static/, or None if it is not a servable image."""
+    from werkzeug.security import safe_join
+
+    if not visual_path.lower().endswith(SERVED_EXTENSIONS):
+        return None
+    path = safe_join(os.path.abspath(STATIC_ROOT), visual_path)
+    return path if path and os.path.isfile(path) else None
+
+
+def cache_lifetime(requested_version, digest):
+    """(max_age, immutable): long-lived only when the URL names the content actually served."""
+    if requested_version and digest.startswith(requested_version):
+        return VERSIONED_MAX_AGE, True
+    return UNVERSIONED_MAX_AGE, False
+
+
+def image_sources(image, url):
+    """URLs for one visual's metadata; url(path, version) builds a /visuals URL.
+
+    Metadata written before thumbnails existed has no version or thumbnail list; both are
+    then looked up on disk.
+    """
+    visual_path = image["visual_path"]
+    version = image.get("version")
+    thumbnails = image.get("thumbnails")
+    if version is None or thumbnails is None:
+        path = resolve(visual_path)
+        if path is not None:
+            version = version or _version(path)
+            if thumbnails is None:
+                thumbnails = [_thumbnail_entry(width, thumbnail_path(path, width))
+                              for width in sorted(THUMBNAIL_WIDTHS, reverse=True)
+                              if os.path.exists(thumbnail_path(path, width))]
+    thumbnails = thumbnails or []
+    full = url(visual_path, version)
+    return {
+        "full": full,
+        # Widest thumbnail for browsers without srcset support
+        "src": url(thumbnails[0]["path"], thumbnails[0]["version"]) if thumbnails else full,
+        "srcset": ", ".join(f"{url(entry['path'], entry['version'])} {entry['width']}w" for entry in thumbnails),
+        "sizes": IMAGE_SIZES,
+    }
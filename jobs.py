@@ -0,0 +1,179 @@
+# jobs.py
+#
+# Background generation jobs. Job records live in the generation_jobs table, so any
+# gunicorn worker can report on a job and a restarted worker picks up jobs that were
+# queued or whose runner died mid-way.
+import os
+import uuid
+import socket
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import Session as DBSession
+
+from database import get_engine
+from models import GenerationJob
+from outputs import output_dir
+from metrics import profiled, count, PROFILE_JOBS
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+# A running job that has not reported progress for this long is assumed orphaned
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))
+FINISHED_STATES = ("completed", "failed", "cancelled")
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="generation-job")
+_worker_id = f"{socket.gethostname()}:{os.getpid()}"
+_resume_lock = threading.Lock()
+_resumed = False
+
+
+def _reset_after_fork():
+    # With gunicorn's preload_app this module is imported in the master; each worker
+    # needs its own id so stale-job detection can tell the workers apart
+    global _worker_id
+    _worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def job_to_dict(job):
+    return {
+        "id": job.id,
+        "username": job.username,
+        "status": job.status,
+        "progress": job.progress,
+        "total": job.sample_count,
+        "images": job.images or [],
+        "error": job.error,
+        "cancel_requested": job.cancel_requested,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+
+def enqueue_generation(username, sample_size, sample_count):
+    """Record a queued job, hand it to the local runner and return its id."""
+    job_id = uuid.uuid4().hex
+    with DBSession(bind=get_engine()) as db:
+        db.add(GenerationJob(id=job_id, username=username, sample_size=sample_size,
+                             sample_count=sample_count, status="queued", progress=0, images=[]))
+        db.commit()
+    _executor.submit(run_job, job_id)
+    return job_id
+
+
+def get_job(job_id):
+    with DBSession(bind=get_engine()) as db:
+        job = db.get(GenerationJob, job_id)
+        return job_to_dict(job) if job else None
+
+
+def cancel_job(job_id, username):
+    """Cancel a queued job immediately, or ask a running one to stop after its current image."""
+    with DBSession(bind=get_engine()) as db:
+        job = db.get(GenerationJob, job_id)
+        if job is None or job.username != username:
+            return None
+        if job.status == "queued":
+            job.status = "cancelled"
+        elif job.status == "running":
+            job.cancel_requested = True
+        job.updated_at = datetime.utcnow()
+        db.commit()
+        return job_to_dict(job)
+
+
+def _claim(job_id):
+    """Atomically take ownership of a queued (or orphaned running) job."""
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=JOB_STALE_SECONDS)
+    with DBSession(bind=get_engine()) as db:
+        claimed = db.query(GenerationJob).filter(
+            GenerationJob.id == job_id,
+            GenerationJob.cancel_requested.is_(False),
+            or_(GenerationJob.status == "queued",
+                and_(GenerationJob.status == "running", GenerationJob.updated_at < stale_before)),
+        ).update({"status": "running", "worker": _worker_id, "progress": 0, "images": [],
+                  "updated_at": now}, synchronize_session=False)
+        db.commit()
+    return claimed == 1
+
+
+def _finish(job_id, status, error=None):
+    with DBSession(bind=get_engine()) as db:
+        job = db.get(GenerationJob, job_id)
+        job.status = status
+        job.error = error
+        job.updated_at = datetime.utcnow()
+        db.commit()
+    count("generation_jobs_total", status=status)
+
+
+def _record_progress(job_id, metadata):
+    """Store one finished image; raises JobCancelled if the job was cancelled meanwhile."""
+    with DBSession(bind=get_engine()) as db:
+        job = db.get(GenerationJob, job_id)
+        job.images = (job.images or []) + [metadata]
+        job.progress = len(job.images)
+        job.updated_at = datetime.utcnow()
+        cancel_requested = job.cancel_requested
+        db.commit()
+    if cancel_requested:
+        raise JobCancelled()
+
+
+def run_job(job_id):
+    if not _claim(job_id):
+        return
+
+    with DBSession(bind=get_engine()) as db:
+        job = db.get(GenerationJob, job_id)
+        sample_size, sample_count = job.sample_size, job.sample_count
+
+    try:
+        from analysis import main as generate_images
+        with profiled(f"job_{job_id}", enabled=PROFILE_JOBS):
+            generate_images(sample_size, sample_count, output_dir=output_dir(job_id),
+                            on_progress=lambda index, metadata: _record_progress(job_id, metadata))
+    except JobCancelled:
+        _finish(job_id, "cancelled")
+    except Exception as e:
+        print(f"❌ Generation job {job_id} failed: {e}")
+        _finish(job_id, "failed", error=str(e))
+    else:
+        _finish(job_id, "completed")
+
+
+def resume_pending_jobs():
+    """Re-submit jobs left queued or orphaned by a previous worker; runs once per process."""
+    global _resumed
+    with _resume_lock:
+        if _resumed:
+            return
+        _resumed = True
+
+    stale_before = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+    with DBSession(bind=get_engine()) as db:
+        # Orphaned jobs the user already asked to stop are simply closed
+        db.query(GenerationJob).filter(
+            GenerationJob.status == "running",
+            GenerationJob.cancel_requested.is_(True),
+            GenerationJob.updated_at < stale_before,
+        ).update({"status": "cancelled", "updated_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+
+        pending = db.query(GenerationJob.id).filter(
+            or_(GenerationJob.status == "queued",
+                and_(GenerationJob.status == "running", GenerationJob.updated_at < stale_before)),
+        ).order_by(GenerationJob.created_at).all()
+
+    for (job_id,) in pending:
+        _executor.submit(run_job, job_id)
@@ -0,0 +1,299 @@
+# loadtest.py
+#
+# Load generator for the survey workflow. Every virtual participant runs a full session
+# with its own cookie jar: register, login, generate, poll the job, view the images and
+# submit the answers. Latency is recorded per route (redirects are not followed, so each
+# request is timed on its own) and reported as p50/p95/p99 with overall throughput.
+#
+#   python loadtest.py --serve --users 40 --concurrency 8 --ramp 10     # local server on SQLite
+#   python loadtest.py --url http://127.0.0.1:8000 --users 100 --concurrency 20
+#   python loadtest.py --serve --server gunicorn --web-workers 4 --baseline cache/loadtest/base.json
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import argparse
+import threading
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+QUESTIONS = ("question1", "question2", "question3")
+POLL_INTERVAL_SECONDS = 1.0
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Recorder:
+    """Thread-safe latency samples per route plus error counts."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, route, seconds, ok):
+        with self.lock:
+            self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+
+class Participant:
+    """One simulated participant: a cookie jar and the requests of a session."""
+
+    def __init__(self, base_url, recorder, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect)
+
+    def request(self, route, path, form=None):
+        """(status, body, headers) of one request, timed under `route`; 3xx counts as success."""
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, data=data, timeout=self.timeout) as response:
+                status, body, headers = response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            status, body, headers = e.code, e.read(), e.headers
+        except (urllib.error.URLError, OSError):
+            self.recorder.add(route, time.perf_counter() - started, False)
+            return None, b"", {}
+        self.recorder.add(route, time.perf_counter() - started, status < 400)
+        return status, body, headers
+
+    def run(self, sample_size, num_samples, job_timeout):
+        name = f"load_{uuid.uuid4().hex[:12]}"
+        self.request("register", "/register", {
+            "username": name, "password": "secret", "first_name": "Load", "last_name": "Test",
+            "email": f"{name}@example.com", "role": "tester", "department": "load",
+        })
+        status, _, _ = self.request("login", "/login", {"username": name, "password": "secret"})
+        if status != 302:
+            return False
+
+        status, _, headers = self.request("generate_samples", "/generate_samples",
+                                          {"sample_size": sample_size, "num_samples": num_samples})
+        location = headers.get("Location", "") if status == 302 else ""
+        job_id = urllib.parse.parse_qs(urllib.parse.urlparse(location).query).get("job", [None])[0]
+        if job_id is None:
+            return False
+
+        deadline = time.monotonic() + job_timeout
+        job = {}
+        while time.monotonic() < deadline:
+            status, body, _ = self.request("job_status", f"/jobs/{job_id}")
+            job = json.loads(body) if status == 200 else {}
+            if job.get("status") in ("completed", "failed", "cancelled"):
+                break
+            time.sleep(POLL_INTERVAL_SECONDS)
+        if job.get("status") != "completed":
+            return False
+
+        status, body, _ = self.request("view_images", f"/view_images?job={job_id}")
+        if status != 200:
+            return False
+        form = {"submission_id": uuid.uuid4().hex}
+        for index, image in enumerate(job.get("images", [])):
+            form[f"image_name_{index}"] = image["visual_path"]
+            for question in QUESTIONS:
+                form[f"{question}_{index}"] = "Yes" if index % 2 else "No"
+        status, _, _ = self.request("submit_response", "/submit_response", form)
+        return status == 302
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, min(len(sorted_values), round(q / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[rank - 1]
+
+
+def summarize(recorder, elapsed, sessions, completed):
+    routes = {}
+    for route, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        routes[route] = {
+            "requests": len(values),
+            "errors": recorder.errors[route],
+            "requests_per_sec": round(len(values) / elapsed, 2),
+            **{f"p{q}_ms": round(percentile(values, q) * 1000, 1) for q in (50, 95, 99)},
+            "max_ms": round(values[-1] * 1000, 1),
+        }
+    total = sum(route["requests"] for route in routes.values())
+    return {
+        "created_at": datetime.utcnow().isoformat(),
+        "duration_seconds": round(elapsed, 2),
+        "sessions": sessions,
+        "sessions_completed": completed,
+        "requests": total,
+        "requests_per_sec": round(total / elapsed, 2),
+        "sessions_per_minute": round(completed / elapsed * 60, 2),
+        "routes": routes,
+    }
+
+
+def print_summary(summary):
+    print(f"{'route':<18} {'reqs':>6} {'errs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for route, stats in summary["routes"].items():
+        print(f"{route:<18} {stats['requests']:>6} {stats['errors']:>5} {stats['p50_ms']:>9.1f} "
+              f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+    print(f"✅ {summary['sessions_completed']}/{summary['sessions']} sessions completed in "
+          f"{summary['duration_seconds']:.1f}s ({summary['requests_per_sec']:.1f} req/s, "
+          f"{summary['sessions_per_minute']:.1f} sessions/min)")
+
+
+def run_load(base_url, users, concurrency, ramp, sample_size, num_samples, timeout, job_timeout):
+    """Start `users` sessions, at most `concurrency` at a time, the first wave spread over `ramp` seconds."""
+    recorder = Recorder()
+
+    def session(index):
+        if index < concurrency:
+            # Later sessions start as soon as a worker frees up
+            time.sleep(index * ramp / concurrency)
+        try:
+            return Participant(base_url, recorder, timeout).run(sample_size, num_samples, job_timeout)
+        except Exception as e:
+            print(f"❌ Session {index} failed: {e}")
+            return False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        completed = sum(executor.map(session, range(users)))
+    return summarize(recorder, time.perf_counter() - started, users, completed)
+
+
+# ---------------------------------------------------------------- local server
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def prepare_database(database_url, workdir, rows):
+    """Create the app's tables and load `rows` synthetic employees through the ETL."""
+    from sqlalchemy import text
+    from database import get_engine, Base
+    import models  # noqa: F401 -- registers the tables
+    from benchmark import dataset_path, write_config
+    from etl_pipeline import ETLPipeline
+
+    engine = get_engine(database_url, statement_timeout_ms=0)
+    Base.metadata.create_all(engine)
+    with engine.connect() as conn:
+        loaded = conn.execute(text("SELECT COUNT(*) FROM cleaned_salary_data2")).scalar() \
+            if engine.dialect.has_table(conn, "cleaned_salary_data2") else 0
+    if loaded != rows:
+        write_config(workdir, dataset_path(workdir, rows, seed=0))
+        ETLPipeline(None, os.path.join(workdir, "config", "config.yaml"), engine=engine).run_pipeline()
+
+
+def start_server(database_url, server, web_workers, port):
+    env = {**os.environ, "DATABASE_URL": database_url, "MPLBACKEND": "Agg"}
+    if server == "gunicorn":
+        env.update(GUNICORN_BIND=f"127.0.0.1:{port}", WEB_CONCURRENCY=str(web_workers))
+        command = [sys.executable, "-m", "gunicorn", "app:app"]
+    else:
+        command = [sys.executable, "-c",
+                   f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    process = subprocess.Popen(command, cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{server} server exited with code {process.returncode}")
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=2).close()
+            return process, base_url
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"{server} server did not start on {base_url}")
+
+
+def compare(summary, baseline, tolerance):
+    """Print p95 and throughput changes per route; returns the routes that got worse than `tolerance`."""
+    regressions = []
+    for route, stats in summary["routes"].items():
+        base = baseline.get("routes", {}).get(route)
+        if not base or not base.get("p95_ms"):
+            continue
+        change = stats["p95_ms"] / base["p95_ms"] - 1
+        flag = "❌" if change > tolerance else "✅"
+        print(f"{flag} {route:<18} p95 {base['p95_ms']:>9.1f} → {stats['p95_ms']:>9.1f} ms ({change * 100:+.1f}%)")
+        if change > tolerance:
+            regressions.append(route)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate concurrent survey participants against the web app.")
+    parser.add_argument("--url", help="Running app to test (default: start one with --serve)")
+    parser.add_argument("--serve", action="store_true", help="Start a local server on a scratch database first")
+    parser.add_argument("--server", choices=["flask", "gunicorn"], default="flask")
+    parser.add_argument("--web-workers", type=int, default=2, help="gunicorn workers when serving with gunicorn")
+    parser.add_argument("--database-url", default=os.getenv("LOADTEST_DATABASE_URL"),
+                        help="Database for --serve (default: a scratch SQLite file)")
+    parser.add_argument("--rows", type=int, default=10_000, help="Synthetic employees loaded for --serve")
+    parser.add_argument("--users", type=int, default=20, help="Sessions to run in total")
+    parser.add_argument("--concurrency", type=int, default=5, help="Sessions running at the same time")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which the first wave starts")
+    parser.add_argument("--sample-size", type=int, default=7)
+    parser.add_argument("--num-samples", type=int, default=2, help="Images generated per session")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--job-timeout", type=float, default=300.0, help="Give up on a generation job after this")
+    parser.add_argument("--workdir", default=os.path.join("cache", "loadtest"))
+    parser.add_argument("--output", default=os.path.join("cache", "loadtest", "results.json"))
+    parser.add_argument("--baseline", help="Earlier results file to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 increase before failing")
+    args = parser.parse_args()
+
+    if not args.url and not args.serve:
+        parser.error("pass --url of a running app or --serve")
+
+    process = None
+    base_url = args.url
+    if args.serve:
+        workdir = os.path.abspath(args.workdir)
+        os.makedirs(workdir, exist_ok=True)
+        database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'loadtest.sqlite')}"
+        prepare_database(database_url, workdir, args.rows)
+        process, base_url = start_server(database_url, args.server, args.web_workers, _free_port())
+        print(f"🚀 Serving on {base_url} ({args.server}, {database_url})")
+
+    try:
+        summary = run_load(base_url, args.users, args.concurrency, args.ramp, args.sample_size, args.num_samples,
+                           args.timeout, args.job_timeout)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    summary.update(url=base_url, users=args.users, concurrency=args.concurrency, ramp=args.ramp,
+                   server=args.server if args.serve else None)
+    print_summary(summary)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"✅ Results written to {args.output}")
+
+    failed = summary["sessions_completed"] < summary["sessions"]
+    if args.baseline:
+        with open(args.baseline) as f:
+            failed = bool(compare(summary, json.load(f), args.tolerance)) or failed
+    sys.exit(1 if failed else 0)
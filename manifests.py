@@ -0,0 +1,135 @@
+# manifests.py
+#
+# Compact, exact descriptions of every generated visual: which employees were drawn (in
+# plotted order), the jitter seed, the plot parameters and the table version. Together
+# with the table this is enough to rebuild the sample frames or re-render the image, so
+# per-image CSVs are only written when WRITE_SAMPLE_CSVS=1 and images can be deleted freely.
+import os
+import argparse
+
+import pandas as pd
+from sqlalchemy.orm import Session as DBSession
+
+from data_access import DEFAULT_TABLE, load_table, get_table_version
+
+WRITE_SAMPLE_CSVS = os.getenv("WRITE_SAMPLE_CSVS", "0") == "1"
+STATIC_DIR = "static"
+
+
+def _engine():
+    from database import engine
+    return engine
+
+
+def manifest_entry(visual_path, kind, male_df, female_df, seed, params=None, data_version=None,
+                   table_name=DEFAULT_TABLE):
+    """Manifest for one visual; `visual_path` is relative to static/ and the frames are in plotted order."""
+    return {
+        "visual_path": visual_path,
+        "kind": kind,
+        "table_name": table_name,
+        "data_version": data_version,
+        "seed": None if seed is None else int(seed),
+        "male_ids": [int(i) for i in male_df["EmployeeID"]],
+        "female_ids": [int(i) for i in female_df["EmployeeID"]],
+        "params": params or {},
+    }
+
+
+def save_manifests(entries):
+    """Insert or replace manifests in a single transaction."""
+    from models import SampleManifest
+
+    if not entries:
+        return
+    with DBSession(bind=_engine()) as db:
+        for entry in entries:
+            db.merge(SampleManifest(**entry))
+        db.commit()
+
+
+def get_manifest(visual_path):
+    from models import SampleManifest
+
+    with DBSession(bind=_engine()) as db:
+        manifest = db.get(SampleManifest, visual_path)
+        if manifest is None:
+            return None
+        return {column.name: getattr(manifest, column.name) for column in SampleManifest.__table__.columns}
+
+
+def sample_frames(manifest, strict=False):
+    """Rebuild (male_df, female_df) in plotted order from the current table.
+
+    With strict=True a manifest recorded against another table version is refused instead
+    of being rebuilt from data that may have changed.
+    """
+    if strict and manifest["data_version"] is not None:
+        current = get_table_version(manifest["table_name"], _engine())
+        if current != manifest["data_version"]:
+            raise ValueError(f"{manifest['visual_path']} was drawn from table version "
+                             f"{manifest['data_version']}, the table is now at {current}.")
+
+    df = load_table(manifest["table_name"], _engine())
+    index = pd.Index(df["EmployeeID"])
+    if not index.is_unique:
+        raise ValueError(f"EmployeeID is not unique in {manifest['table_name']}; samples cannot be rebuilt by ID.")
+    frames = []
+    for ids in (manifest["male_ids"], manifest["female_ids"]):
+        positions = index.get_indexer(ids)
+        if (positions < 0).any():
+            raise ValueError(f"{manifest['visual_path']}: some employees are no longer in {manifest['table_name']}.")
+        frames.append(df.iloc[positions].reset_index(drop=True))
+    return frames[0], frames[1]
+
+
+def sample_csv(manifest):
+    """The combined Red/Blue CSV the generators used to write for each visual."""
+    male_df, female_df = sample_frames(manifest)
+    return pd.concat([male_df.assign(Group="Red"), female_df.assign(Group="Blue")], ignore_index=True)
+
+
+def rerender(visual_path, image_path=None, strict=False):
+    """Re-create a visual from its manifest (through the render cache); returns the image path."""
+    manifest = get_manifest(visual_path)
+    if manifest is None:
+        raise KeyError(f"No manifest for {visual_path}")
+    image_path = image_path or os.path.join(STATIC_DIR, visual_path)
+    os.makedirs(os.path.dirname(image_path) or ".", exist_ok=True)
+    male_df, female_df = sample_frames(manifest, strict=strict)
+    params = manifest["params"]
+
+    if manifest["kind"] == "abstract":
+        from analysis import render_abstract
+        render_abstract(male_df, female_df, image_path, manifest["seed"], params.get("backend"),
+                        params.get("dpi"), manifest["data_version"], thumbnails=True)
+    elif manifest["kind"] == "side_by_side":
+        from generate_cluster_visuals import cached_plot_side_by_side
+        cached_plot_side_by_side(male_df, female_df, image_path, manifest["seed"], **params)
+    else:
+        raise ValueError(f"Unknown visual kind: {manifest['kind']}")
+    return image_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild visuals or sample CSVs from their manifests.")
+    parser.add_argument("action", choices=["render", "csv"])
+    parser.add_argument("visual_path", help="Visual path relative to static/, e.g. visuals/High_Low/visual_1.png")
+    parser.add_argument("--out", help="Where to write (default: the original image path / stdout for csv)")
+    parser.add_argument("--strict", action="store_true", help="Refuse manifests from another table version")
+    args = parser.parse_args()
+
+    if args.action == "render":
+        print(f"✅ Rendered {rerender(args.visual_path, args.out, strict=args.strict)}")
+    else:
+        manifest = get_manifest(args.visual_path)
+        if manifest is None:
+            raise SystemExit(f"❌ No manifest for {args.visual_path}")
+        if args.strict:
+            sample_frames(manifest, strict=True)
+        frame = sample_csv(manifest)
+        if args.out:
+            frame.to_csv(args.out, index=False)
+            print(f"✅ Wrote {args.out}")
+        else:
+            print(frame.to_csv(index=False), end="")
@@ -0,0 +1,219 @@
+# metrics.py
+#
+# In-process timers, counters and histograms for the pipeline's hot paths, exposed in
+# Prometheus text format by the app's /metrics endpoint. Every timed block is also
+# appended as one JSON line to logs/timings.jsonl (METRICS_TIMING_LOG, empty to disable).
+# Render-pool workers send their observations back with each result (see render_pool),
+# so parallel renders show up in the parent's metrics too.
+#
+# Opt-in profiling: PROFILE_REQUESTS=1 lets a request ask for a profile with ?profile=1,
+# PROFILE_JOBS=1 profiles every generation job. Profiles go to logs/profiles/ (cProfile
+# .prof files, or pyinstrument .html with PROFILER=pyinstrument).
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+
+TIMING_LOG = os.getenv("METRICS_TIMING_LOG", os.path.join("logs", "timings.jsonl"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("logs", "profiles"))
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0") == "1"
+PROFILE_JOBS = os.getenv("PROFILE_JOBS", "0") == "1"
+PROFILER = os.getenv("PROFILER", "cprofile")
+# Seconds; spans sub-millisecond DB reads up to multi-minute ETL loads
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_timing_logger = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def count(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        histogram[bisect.bisect_left(BUCKETS, value)] += 1
+        histogram[-1] += value
+
+
+def _timings():
+    global _timing_logger
+    if _timing_logger is None and TIMING_LOG:
+        logger = logging.getLogger("timings")
+        logger.propagate = False  # keep timing records out of the ETL log
+        if not logger.handlers:
+            os.makedirs(os.path.dirname(TIMING_LOG) or ".", exist_ok=True)
+            handler = logging.FileHandler(TIMING_LOG)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+        _timing_logger = logger
+    return _timing_logger
+
+
+@contextmanager
+def timed(name, **labels):
+    """Time the block into the `<name>_seconds` histogram and the timing log.
+
+    Use as `with timed("render", kind="abstract"):` or as a decorator `@timed("etl", stage="load")`.
+    """
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        observe(f"{name}_seconds", seconds, **labels)
+        logger = _timings()
+        if logger is not None:
+            logger.info(json.dumps({"ts": datetime.utcnow().isoformat(), "name": name, "seconds": round(seconds, 6),
+                                    "status": status, "pid": os.getpid(), **labels}, default=str))
+
+
+def drain():
+    """Take (and reset) everything recorded in this process, for shipping to another one."""
+    global _counters, _histograms
+    with _lock:
+        snapshot = {"counters": _counters, "histograms": _histograms}
+        _counters, _histograms = {}, {}
+    return snapshot
+
+
+def merge(snapshot):
+    """Add observations drained in another process (e.g. a render worker)."""
+    with _lock:
+        for key, value in snapshot["counters"].items():
+            _counters[key] = _counters.get(key, 0) + value
+        for key, values in snapshot["histograms"].items():
+            histogram = _histograms.setdefault(key, [0] * (len(BUCKETS) + 1) + [0.0])
+            for i, value in enumerate(values):
+                histogram[i] += value
+
+
+# ---------------------------------------------------------------- Prometheus exposition
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _scraped():
+    """(name, type, labels, value) read at scrape time from the DB pools and the render cache."""
+    import render_cache
+    from database import pool_stats
+
+    samples = []
+    for engine_name, stats in pool_stats().items():
+        labels = (("engine", engine_name),)
+        for field, value in stats.items():
+            if value is None:
+                continue
+            if field in ("size", "checked_out", "overflow"):
+                samples.append((f"db_pool_{field}", "gauge", labels, value))
+            else:
+                samples.append((f"db_pool_{field}_total", "counter", labels, value))
+    for field, value in render_cache.stats().items():
+        samples.append((f"render_cache_{field}_total", "counter", (), value))
+    return samples
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, list(values)) for key, values in _histograms.items())
+
+    lines = []
+    typed = set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), values in histograms:
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS + ("+Inf",), values[:-1]):
+            cumulative += bucket
+            lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {values[-1]}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    for name, kind, labels, value in _scraped():
+        if name not in typed:
+            lines.append(f"# TYPE {name} {kind}")
+            typed.add(name)
+        lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------- profiling
+
+@contextmanager
+def profiled(name, enabled=True):
+    """Profile the block into PROFILE_DIR/<timestamp>_<name>.prof (or .html with pyinstrument)."""
+    if not enabled:
+        yield None
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = os.path.join(PROFILE_DIR, f"{datetime.utcnow():%Y%m%dT%H%M%S%f}_{name}")
+    if PROFILER == "pyinstrument":
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield f"{stem}.html"
+        finally:
+            profiler.stop()
+            with open(f"{stem}.html", "w") as f:
+                f.write(profiler.output_html())
+    else:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profile (e.g. a concurrent job) is already running in this process
+            yield None
+            return
+        try:
+            yield f"{stem}.prof"
+        finally:
+            profiler.disable()
+            profiler.dump_stats(f"{stem}.prof")
+
+
+def call_collecting(func, task):
+    """Run func(task) in a pool worker and return (result, metrics recorded meanwhile)."""
+    result = func(task)
+    return result, drain()
+
+
+def collecting(func):
+    return functools.partial(call_collecting, func)
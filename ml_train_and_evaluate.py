@@ -1,89 +1,259 @@
+import uuid
+import argparse
+import yaml
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine
-from sklearn.linear_model import LinearRegression
-
-# DB Configuration
-db_config = {
-    'user': 'postgres',
-    'password': '1234',
-    'host': 'localhost',
-    'port': 5432,
-    'database': 'etl_pipeline_db'
+from sqlalchemy import insert
+from data_access import load_table
+from database import get_engine
+from clustering import load_clustering_config, assign_clusters, dimension_codes
+from render_pool import run_tasks
+
+DEFAULT_EVALUATION = {
+    "features": ["TotalWorkingYears", "Age"],
+    "target": "MonthlyIncome",
+    "group_by": ["Gender"],
+    "include_all": True,
+    "bootstrap": 1000,
+    "confidence": 0.95,
 }
+# Rows per block when computing errors, bounding the (rows x models) prediction matrix
+CHUNK_ROWS = 200_000
+# Target size (rows x replicates x models) of one bootstrap chunk's prediction array
+BOOTSTRAP_CHUNK_CELLS = 4_000_000
+
+
+def load_evaluation_config(config_file="config/config.yaml"):
+    with open(config_file) as f:
+        dataset = yaml.safe_load(f).get("dataset", {})
+    return {**DEFAULT_EVALUATION, **(dataset.get("evaluation") or {})}
 
-engine = create_engine(
-    f"postgresql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
-)
 
-# Load data
-df = pd.read_sql("SELECT * FROM cleaned_salary_data2;", engine)
+def build_groups(df, group_by, include_all=True, config_file="config/config.yaml"):
+    """Named boolean row masks: one per value of each `group_by` column, plus "All".
 
-# Check required columns
-required_columns = {"Gender", "TotalWorkingYears", "Age", "MonthlyIncome"}
-if not required_columns.issubset(df.columns):
-    raise ValueError("Missing required columns")
+    Numeric columns are split into quantile bins as in the clustering config (median by
+    default) and "Cluster" uses the configured clustering itself.
+    """
+    clustering = load_clustering_config(config_file)
+    groups = {}
+    for column in group_by:
+        if column == "Cluster":
+            df, names = assign_clusters(df.copy(deep=False), clustering)
+            codes = df["ClusterID"].to_numpy()
+        else:
+            dimension = next((d for d in clustering.get("dimensions", []) if d["column"] == column),
+                             {"column": column})
+            codes, names = dimension_codes(df[column], dimension)
+            if pd.api.types.is_numeric_dtype(df[column]) and dimension.get("type") != "category":
+                names = [f"{column} {name}" for name in names]
+        for code, name in enumerate(names):
+            mask = codes == code
+            if mask.any():
+                groups[name] = mask
+    if include_all:
+        groups["All"] = np.ones(len(df), dtype=bool)
+    return groups
 
-# Encode gender
-df['Gender'] = df['Gender'].map({'Male': 0, 'Female': 1})
 
-# Feature and target selection
-X_cols = ['TotalWorkingYears', 'Age']
-y_col = 'MonthlyIncome'
+def fit_group_models(X, y, masks):
+    """Ordinary least squares (with intercept) per group; returns coefficients as (features + 1, groups)."""
+    design = np.column_stack([np.ones(len(X)), X])
+    return np.column_stack([np.linalg.lstsq(design[mask], y[mask], rcond=None)[0] for mask in masks])
 
-df_male = df[df["Gender"] == 0]
-df_female = df[df["Gender"] == 1]
 
-def train_model(X, y):
-    model = LinearRegression()
-    model.fit(X, y)
-    return model
+def mae_matrix(X, y, coefficients, masks, chunk_rows=CHUNK_ROWS):
+    """MAE of every model on every group: entry [m, d] is model m tested on group d.
 
-def evaluate_and_store_results(model, X_test, y_test, model_type, test_dataset, phase):
+    All models predict every row in one matrix product per block, and the absolute errors
+    are summed per group with a second product against the group masks.
     """
-    phase = 'Before Swap' or 'After Swap'
+    mask_matrix = np.column_stack(masks).astype(float)
+    error_sums = np.zeros((coefficients.shape[1], mask_matrix.shape[1]))
+    for start in range(0, len(X), chunk_rows):
+        block = slice(start, start + chunk_rows)
+        design = np.column_stack([np.ones(len(X[block])), X[block]])
+        errors = np.abs(y[block, None] - design @ coefficients)
+        error_sums += errors.T @ mask_matrix[block]
+    return error_sums / mask_matrix.sum(axis=0)
+
+
+def bootstrap_chunk(task):
+    """MAE matrices for `replicates` bootstrap resamples of the rows; runs in a pool worker.
+
+    Each resample is a vector of multinomial row counts used as weights, so every group
+    model is refit in closed form (weighted normal equations, solved for all replicates
+    at once) instead of building new model objects.
+    """
+    seed, replicates, X, y, mask_matrix = task
+    rng = np.random.default_rng(seed)
+    n = len(y)
+    design = np.column_stack([np.ones(n), X])
+
+    draws = rng.integers(0, n, size=(replicates, n)) + n * np.arange(replicates)[:, None]
+    counts = np.bincount(draws.ravel(), minlength=replicates * n).reshape(replicates, n).astype(float)
+
+    groups = mask_matrix.shape[1]
+    coefficients = np.empty((replicates, design.shape[1], groups))
+    for g in range(groups):
+        weights = counts * mask_matrix[:, g]
+        gram = np.transpose(weights[:, :, None] * design, (0, 2, 1)) @ design
+        moment = (weights * y) @ design
+        # pinv: a resample can leave a small group with a singular system
+        coefficients[:, :, g] = np.einsum("bij,bj->bi", np.linalg.pinv(gram), moment)
+
+    errors = np.abs(y[None, :, None] - np.einsum("ni,big->bng", design, coefficients))
+    weighted_masks = counts[:, :, None] * mask_matrix[None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.einsum("bng,bnd->bgd", errors, weighted_masks) / weighted_masks.sum(axis=1)[:, None, :]
+
+
+def bootstrap_mae(X, y, masks, replicates, seed=None, workers=None):
+    """(replicates, models, groups) bootstrap MAE matrices, computed in chunks across the render pool.
+
+    Chunks get independent child seeds, so results do not depend on the worker count.
+    """
+    mask_matrix = np.column_stack(masks).astype(float)
+    chunk = max(1, min(replicates, BOOTSTRAP_CHUNK_CELLS // (len(y) * len(masks))))
+    sizes = [min(chunk, replicates - start) for start in range(0, replicates, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(child, size, X, y, mask_matrix) for child, size in zip(seeds, sizes)]
+    return np.concatenate(list(run_tasks(bootstrap_chunk, tasks, workers)))
+
+
+def swap_statistics(matrix, samples, confidence=0.95):
+    """Percentile CIs for every cell and two-sided p-values for each swap penalty.
+
+    The swap penalty of model m on group d is MAE[m, d] - MAE[d, d] (compared with the
+    group's own model); its p-value is twice the smaller bootstrap tail beyond zero.
+    Own-group cells get no p-value.
+    """
+    alpha = (1 - confidence) / 2
+    lower = np.nanquantile(samples, alpha, axis=0)
+    upper = np.nanquantile(samples, 1 - alpha, axis=0)
+
+    own = np.diagonal(samples, axis1=1, axis2=2)[:, None, :]
+    penalties = samples - own
+    valid = (~np.isnan(penalties)).sum(axis=0)
+    below = (penalties <= 0).sum(axis=0)
+    above = (penalties >= 0).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p_values = np.minimum(1.0, 2 * np.minimum(below + 1, above + 1) / (valid + 1))
+    np.fill_diagonal(p_values, np.nan)
+    return lower, upper, p_values
+
+
+def evaluate_groups(df, groups, features, target, bootstrap=0, confidence=0.95, seed=None, workers=None):
+    """Fit one model per group and return (group names, MAE matrix, rows per group, statistics).
+
+    With bootstrap > 0, statistics is (ci_lower, ci_upper, p_values), each models x groups;
+    otherwise None.
     """
-    y_pred = model.predict(X_test)
-    error = float(np.mean(abs(y_test - y_pred)))  # Convert np.float64 to float
-
-    # Display to console
-    print("=" * 60)
-    print(f"{phase} | {model_type} tested on {test_dataset}")
-    print(f"→ Mean Absolute Error (MAE): {error:.2f}")
-    print("=" * 60)
-
-    # Store in PostgreSQL
-    conn = engine.raw_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO model_predictions (model_type, test_dataset, mean_absolute_error, phase) VALUES (%s, %s, %s, %s)",
-        (model_type, test_dataset, error, phase)
-    )
-
-
-    conn.commit()
-    cur.close()
-    conn.close()
-
-
-
-# Prepare data
-X_male, y_male = df_male[X_cols], df_male[y_col]
-X_female, y_female = df_female[X_cols], df_female[y_col]
-X_all, y_all = df[X_cols], df[y_col]
-
-# Train models
-male_model = train_model(X_male, y_male)
-female_model = train_model(X_female, y_female)
-combined_model = train_model(X_all, y_all)
-# BEFORE SWAP: Each model tested on its own data
-evaluate_and_store_results(male_model, X_male, y_male, "Male Model", "Male Data", "Before Swap")
-evaluate_and_store_results(female_model, X_female, y_female, "Female Model", "Female Data", "Before Swap")
-evaluate_and_store_results(combined_model, X_all, y_all, "Combined Model", "All Data", "Before Swap")
-
-# AFTER SWAP: Models tested on other groups
-evaluate_and_store_results(male_model, X_female, y_female, "Male Model", "Female Data", "After Swap")
-evaluate_and_store_results(female_model, X_male, y_male, "Female Model", "Male Data", "After Swap")
-evaluate_and_store_results(combined_model, X_male, y_male, "Combined Model", "Male Data", "After Swap")
-evaluate_and_store_results(combined_model, X_female, y_female, "Combined Model", "Female Data", "After Swap")
+    X = df[features].to_numpy(dtype=float)
+    y = df[target].to_numpy(dtype=float)
+    names = list(groups)
+    masks = [groups[name] for name in names]
+    coefficients = fit_group_models(X, y, masks)
+    matrix = mae_matrix(X, y, coefficients, masks)
+    statistics = None
+    if bootstrap:
+        statistics = swap_statistics(matrix, bootstrap_mae(X, y, masks, bootstrap, seed, workers), confidence)
+    return names, matrix, [int(mask.sum()) for mask in masks], statistics
+
+
+def model_label(name):
+    return "Combined Model" if name == "All" else f"{name} Model"
+
+
+def data_label(name):
+    return "All Data" if name == "All" else f"{name} Data"
+
+
+def _optional(value):
+    return None if np.isnan(value) else float(value)
+
+
+def result_rows(names, matrix, counts, run_id, statistics=None, bootstrap=0):
+    rows = []
+    for m, model_name in enumerate(names):
+        for d, data_name in enumerate(names):
+            row = {
+                "run_id": run_id,
+                "model_type": model_label(model_name),
+                "test_dataset": data_label(data_name),
+                "mean_absolute_error": float(matrix[m, d]),
+                "phase": "Before Swap" if m == d else "After Swap",
+                "n_test": counts[d],
+                "ci_lower": None,
+                "ci_upper": None,
+                "p_value": None,
+                "n_bootstrap": bootstrap or None,
+            }
+            if statistics is not None:
+                lower, upper, p_values = statistics
+                row.update(ci_lower=_optional(lower[m, d]), ci_upper=_optional(upper[m, d]),
+                           p_value=_optional(p_values[m, d]))
+            rows.append(row)
+    return rows
+
+
+def store_results(rows, engine):
+    """Insert a whole run's matrix in one transaction."""
+    from models import ModelPrediction
+
+    with engine.begin() as conn:
+        conn.execute(insert(ModelPrediction.__table__), rows)
+
+
+def print_results(rows):
+    for phase in ("Before Swap", "After Swap"):
+        for row in rows:
+            if row["phase"] != phase:
+                continue
+            print("=" * 60)
+            print(f"{phase} | {row['model_type']} tested on {row['test_dataset']}")
+            print(f"→ Mean Absolute Error (MAE): {row['mean_absolute_error']:.2f}")
+            if row["ci_lower"] is not None:
+                print(f"→ {row['n_bootstrap']}-resample CI: [{row['ci_lower']:.2f}, {row['ci_upper']:.2f}]")
+            if row["p_value"] is not None:
+                print(f"→ p-value of the swap penalty: {row['p_value']:.4f}")
+            print("=" * 60)
+
+
+def run_evaluation(df=None, config_file="config/config.yaml", engine=None, store=True, bootstrap=None,
+                   seed=None, workers=None):
+    """Evaluate every configured group model on every group and store the matrix under a new run id."""
+    engine = engine or get_engine()
+    config = load_evaluation_config(config_file)
+    bootstrap = config["bootstrap"] if bootstrap is None else bootstrap
+    if df is None:
+        df = load_table("cleaned_salary_data2", engine)
+
+    # Check required columns
+    required_columns = set(config["features"]) | {config["target"]} | (set(config["group_by"]) - {"Cluster"})
+    if not required_columns.issubset(df.columns):
+        raise ValueError("Missing required columns")
+
+    groups = build_groups(df, config["group_by"], config["include_all"], config_file)
+    names, matrix, counts, statistics = evaluate_groups(df, groups, config["features"], config["target"],
+                                                        bootstrap, config["confidence"], seed, workers)
+    run_id = uuid.uuid4().hex
+    rows = result_rows(names, matrix, counts, run_id, statistics, bootstrap)
+    print_results(rows)
+    if store:
+        store_results(rows, engine)
+        print(f"✅ Stored {len(rows)} results for {len(names)} groups (run {run_id})")
+    return run_id, rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit a model per group and test every model on every group.")
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--dry-run", action="store_true", help="Print the results without storing them")
+    parser.add_argument("--bootstrap", type=int, help="Resamples for CIs and p-values (0 = none; default from config)")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible resampling")
+    parser.add_argument("--workers", type=int, help="Processes used for resampling")
+    args = parser.parse_args()
 
+    run_evaluation(config_file=args.config, store=not args.dry_run, bootstrap=args.bootstrap, seed=args.seed,
+                   workers=args.workers)
@@ -1,5 +1,5 @@
 from database import Base
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Boolean, Float, DateTime, ForeignKey, JSON, Index
 from datetime import datetime
 
 class User(Base):
@@ -27,6 +27,12 @@ class UserSession(Base):
 
 class UserResponse(Base):
     __tablename__ = 'user_responses'
+    __table_args__ = (
+        # One answer per image per form submission, so a retried POST inserts nothing new
+        Index('uq_user_responses_submission_image', 'submission_id', 'image_name', unique=True),
+        Index('ix_user_responses_username_image', 'username', 'image_name'),
+        Index('ix_user_responses_timestamp', 'timestamp'),
+    )
 
     id = Column(Integer, primary_key=True)
     username = Column(String, nullable=False)
@@ -35,3 +41,68 @@ class UserResponse(Base):
     question2 = Column(String, nullable=False)
     question3 = Column(String, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    submission_id = Column(String(32))  # NULL for rows stored before idempotency keys
+
+class ImageResponseRollup(Base):
+    """Answer counts per image and question, kept current by response_analytics."""
+    __tablename__ = 'response_rollups_image'
+
+    image_name = Column(String, primary_key=True)
+    question = Column(String(20), primary_key=True)
+    answer = Column(String(50), primary_key=True)
+    cluster = Column(String(120))
+    count = Column(Integer, nullable=False, default=0)
+
+class ClusterResponseRollup(Base):
+    """Answer counts per cluster and question; images without a cluster count under ''."""
+    __tablename__ = 'response_rollups_cluster'
+
+    cluster = Column(String(120), primary_key=True)
+    question = Column(String(20), primary_key=True)
+    answer = Column(String(50), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class GenerationJob(Base):
+    __tablename__ = 'generation_jobs'
+
+    id = Column(String(32), primary_key=True)
+    username = Column(String(80), nullable=False)
+    sample_size = Column(Integer, nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False, default='queued')
+    progress = Column(Integer, nullable=False, default=0)
+    images = Column(JSON, nullable=False, default=list)
+    error = Column(Text)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    worker = Column(String(120))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class SampleManifest(Base):
+    __tablename__ = 'sample_manifests'
+
+    visual_path = Column(String(255), primary_key=True)  # relative to static/
+    kind = Column(String(20), nullable=False)  # abstract | side_by_side
+    table_name = Column(String(120), nullable=False)
+    data_version = Column(String(64))
+    seed = Column(BigInteger)
+    male_ids = Column(JSON, nullable=False)  # in plotted order
+    female_ids = Column(JSON, nullable=False)
+    params = Column(JSON, nullable=False, default=dict)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ModelPrediction(Base):
+    __tablename__ = 'model_predictions'
+
+    id = Column(Integer, primary_key=True)
+    run_id = Column(String(32), index=True)  # one evaluation run = one full model x dataset matrix
+    model_type = Column(String(120), nullable=False)  # e.g. "Male Model"
+    test_dataset = Column(String(120), nullable=False)  # e.g. "Female Data"
+    mean_absolute_error = Column(Float, nullable=False)
+    phase = Column(String(20), nullable=False)  # Before Swap (own group) | After Swap
+    n_test = Column(Integer)
+    ci_lower = Column(Float)  # bootstrap percentile interval of the MAE
+    ci_upper = Column(Float)
+    p_value = Column(Float)  # two-sided bootstrap p-value of the swap penalty; NULL for own-group rows
+    n_bootstrap = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
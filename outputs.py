@@ -0,0 +1,86 @@
+# outputs.py
+#
+# Per-job output namespaces under static/generated/<namespace>/ and a background
+# garbage collector, so concurrent participants never delete each other's images.
+import os
+import time
+import shutil
+import threading
+
+STATIC_ROOT = "static"
+OUTPUT_ROOT = os.path.join(STATIC_ROOT, "generated")
+OUTPUT_TTL_SECONDS = int(os.getenv("OUTPUT_TTL_SECONDS", str(6 * 3600)))
+OUTPUT_MAX_BYTES = int(os.getenv("OUTPUT_MAX_BYTES", str(2 * 1024 ** 3)))
+# Namespaces touched more recently than this are never evicted for size
+OUTPUT_MIN_AGE_SECONDS = int(os.getenv("OUTPUT_MIN_AGE_SECONDS", "900"))
+GC_INTERVAL_SECONDS = int(os.getenv("OUTPUT_GC_INTERVAL_SECONDS", "300"))
+
+_gc_thread = None
+_gc_lock = threading.Lock()
+
+
+def output_dir(namespace):
+    """Directory for one job's images, visuals.json and (opt-in) sample CSVs."""
+    path = os.path.join(OUTPUT_ROOT, namespace)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _namespace_usage(path):
+    size = 0
+    last_modified = os.path.getmtime(path)
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            size += stat.st_size
+            last_modified = max(last_modified, stat.st_mtime)
+    return size, last_modified
+
+
+def collect_garbage(ttl=OUTPUT_TTL_SECONDS, max_bytes=OUTPUT_MAX_BYTES, min_age=OUTPUT_MIN_AGE_SECONDS):
+    """Delete namespaces older than `ttl`, then the oldest ones until under `max_bytes`."""
+    if not os.path.isdir(OUTPUT_ROOT):
+        return 0
+
+    now = time.time()
+    namespaces = []
+    for entry in os.listdir(OUTPUT_ROOT):
+        path = os.path.join(OUTPUT_ROOT, entry)
+        if os.path.isdir(path):
+            size, last_modified = _namespace_usage(path)
+            namespaces.append((last_modified, size, path))
+    namespaces.sort()
+
+    removed = 0
+    total = sum(size for _, size, _ in namespaces)
+    for last_modified, size, path in namespaces:
+        age = now - last_modified
+        if age > ttl or (total > max_bytes and age > min_age):
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+
+    if removed:
+        print(f"🧹 Removed {removed} expired output folders ({total / 1024 ** 2:.1f} MB kept)")
+    return removed
+
+
+def _gc_loop(interval):
+    while True:
+        try:
+            collect_garbage()
+        except Exception as e:
+            print(f"❌ Output garbage collection failed: {e}")
+        time.sleep(interval)
+
+
+def start_gc_thread(interval=GC_INTERVAL_SECONDS):
+    """Start the collector once per process."""
+    global _gc_thread
+    with _gc_lock:
+        if _gc_thread is None:
+            _gc_thread = threading.Thread(target=_gc_loop, args=(interval,), daemon=True, name="output-gc")
+            _gc_thread.start()
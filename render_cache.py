@@ -0,0 +1,131 @@
+# render_cache.py
+#
+# Content-addressed cache for rendered visuals. An image is keyed by the employees it
+# shows, the jitter seed, the plot parameters and the data it was drawn from, so asking
+# for the same picture again links the stored file instead of re-rendering it.
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+
+import numpy as np
+
+CACHE_DIR = os.getenv("RENDER_CACHE_DIR", os.path.join("cache", "renders"))
+CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(1024 ** 3)))
+PLOTTED_COLUMNS = ["EmployeeID", "TotalWorkingYears", "Age", "MonthlyIncome"]
+
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+
+
+def render_key(male_df, female_df, seed, params, data_version=None):
+    """Hash of everything that determines the pixels of a red/blue visual.
+
+    Frames must already be in the order they are plotted (callers sort by EmployeeID),
+    since the jitter drawn from `seed` is assigned by position.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        "male_ids": male_df["EmployeeID"].tolist(),
+        "female_ids": female_df["EmployeeID"].tolist(),
+        "seed": seed,
+        "params": params,
+        "data_version": data_version,
+    }, sort_keys=True, default=str).encode())
+    # The plotted values themselves, so unversioned data can never serve a stale image
+    for frame in (male_df, female_df):
+        digest.update(np.ascontiguousarray(frame[PLOTTED_COLUMNS].to_numpy(dtype="float64")).tobytes())
+    return digest.hexdigest()
+
+
+def _cache_path(key, extension):
+    return os.path.join(CACHE_DIR, key[:2], f"{key}{extension}")
+
+
+def _publish(source, destination):
+    """Expose a cached file at `destination`, hard-linking when the filesystem allows it."""
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def record(hit):
+    """Count a lookup; exposed so pool parents can tally results reported by workers."""
+    with _stats_lock:
+        _stats["hits" if hit else "misses"] += 1
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def cached_render(key, image_path, render):
+    """Place the image for `key` at `image_path`, calling render(path) only on a miss.
+
+    Returns True on a cache hit. Counting is left to the caller (see record()) because
+    the lookup usually happens inside a render worker process.
+    """
+    extension = os.path.splitext(image_path)[1]
+    cached = _cache_path(key, extension)
+
+    if os.path.exists(cached):
+        os.utime(cached)  # mtime doubles as the LRU clock
+        _publish(cached, image_path)
+        return True
+
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    # Unique per call: job threads in one process may render the same key at the same time
+    tmp_path = f"{cached}.tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}{extension}"
+    try:
+        render(tmp_path)
+        os.replace(tmp_path, cached)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _publish(cached, image_path)
+    evict()
+    return False
+
+
+def evict(max_bytes=CACHE_MAX_BYTES):
+    """Drop least recently used entries until the cache fits in `max_bytes`."""
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+
+    entries = []
+    total = 0
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            if ".tmp-" in name:
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+
+    with _stats_lock:
+        _stats["evictions"] += removed
+    return removed
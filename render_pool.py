@@ -0,0 +1,61 @@
+# render_pool.py
+#
+# Process pool for figure rendering. Workers are forked from a forkserver that has
+# already imported matplotlib with the Agg backend, so the import cost is paid once
+# and rendering never touches a GUI backend or the parent's threads.
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+DEFAULT_WORKERS = int(os.getenv("RENDER_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+
+_pool = None
+_pool_workers = 0
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401 -- warm the import before the first task arrives
+
+
+def _mp_context():
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["matplotlib.pyplot"])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def get_pool(workers):
+    """Shared pool, rebuilt only when the requested size changes."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context(), initializer=_init_worker)
+        _pool_workers = workers
+    return _pool
+
+
+def run_tasks(func, tasks, workers=None):
+    """Yield func(task) for every task, in task order.
+
+    `func` must be a module-level function so it can be pickled. With one worker (or one
+    task) everything runs in-process, which keeps tracebacks simple when debugging.
+    Timings recorded in pool workers come back with each result and are merged here.
+    """
+    workers = DEFAULT_WORKERS if workers is None else workers
+    tasks = list(tasks)
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield func(task)
+        return
+
+    for result, observed in get_pool(workers).map(metrics.collecting(func), tasks):
+        metrics.merge(observed)
+        yield result
@@ -0,0 +1,173 @@
+# response_analytics.py
+#
+# Answer distributions over user_responses, served from two small rollup tables
+# (per image and per cluster) instead of scanning every response. The rollups are
+# incremented in the same transaction that stores a submission, and can be rebuilt
+# from scratch with `python response_analytics.py --rebuild`.
+import os
+import re
+import json
+import argparse
+import threading
+from collections import Counter, defaultdict
+
+from sqlalchemy import select, delete, insert, text
+
+from database import get_engine
+from models import ImageResponseRollup, ClusterResponseRollup
+
+QUESTIONS = ("question1", "question2", "question3")
+VISUALS_FILE = os.path.join("static", "visuals.json")
+# Cluster visuals are stored as visuals/<cluster>/visual_<i>.png (see generate_cluster_visuals)
+CLUSTER_IMAGE_PATTERN = re.compile(r"^(?:visuals/)?([^/]+)/visual_\d+\.\w+$")
+UNCLUSTERED = ""
+
+_visuals_index = {"mtime": None, "clusters": {}}
+_visuals_lock = threading.Lock()
+
+
+def _visuals_clusters():
+    """image key -> cluster from static/visuals.json, reloaded only when the file changes."""
+    try:
+        mtime = os.stat(VISUALS_FILE).st_mtime
+    except FileNotFoundError:
+        return {}
+    with _visuals_lock:
+        if _visuals_index["mtime"] != mtime:
+            with open(VISUALS_FILE) as f:
+                visuals = json.load(f)
+            # analysis.py writes a list without clusters; generate_cluster_visuals a dict with them
+            _visuals_index["clusters"] = ({key: entry.get("cluster") for key, entry in visuals.items()
+                                           if isinstance(entry, dict) and entry.get("cluster")}
+                                          if isinstance(visuals, dict) else {})
+            _visuals_index["mtime"] = mtime
+        return _visuals_index["clusters"]
+
+
+def image_cluster(image_name):
+    """Cluster an image was drawn from, or None for whole-table samples."""
+    key = image_name[len("visuals/"):] if image_name.startswith("visuals/") else image_name
+    cluster = _visuals_clusters().get(key)
+    if cluster:
+        return cluster
+    match = CLUSTER_IMAGE_PATTERN.match(image_name)
+    return match.group(1) if match else None
+
+
+def _count_rows(rows):
+    image_counts = Counter()
+    cluster_counts = Counter()
+    for row in rows:
+        cluster = image_cluster(row["image_name"])
+        for question in QUESTIONS:
+            image_counts[(row["image_name"], question, row[question], cluster)] += 1
+            cluster_counts[(cluster or UNCLUSTERED, question, row[question])] += 1
+    # Sorted, so concurrent submissions lock rollup rows in the same order
+    image_rows = [{"image_name": image, "question": question, "answer": answer, "cluster": cluster, "count": n}
+                  for (image, question, answer, cluster), n in sorted(image_counts.items(), key=lambda i: i[0][:3])]
+    cluster_rows = [{"cluster": cluster, "question": question, "answer": answer, "count": n}
+                    for (cluster, question, answer), n in sorted(cluster_counts.items())]
+    return image_rows, cluster_rows
+
+
+def _increment(conn, table, rows, keys):
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    statement = dialect_insert(table)
+    statement = statement.on_conflict_do_update(index_elements=keys,
+                                                set_={"count": table.c.count + statement.excluded.count})
+    conn.execute(statement, rows)
+
+
+def update_rollups(conn, rows):
+    """Add newly stored response rows to the rollups, inside the caller's transaction.
+
+    Returns False (leaving the rollups to the next rebuild) on databases without upserts.
+    """
+    if not rows:
+        return True
+    if conn.dialect.name not in ("postgresql", "sqlite"):
+        return False
+    image_rows, cluster_rows = _count_rows(rows)
+    _increment(conn, ImageResponseRollup.__table__, image_rows, ["image_name", "question", "answer"])
+    _increment(conn, ClusterResponseRollup.__table__, cluster_rows, ["cluster", "question", "answer"])
+    return True
+
+
+def rebuild_rollups():
+    """Recompute both rollups from user_responses in one transaction."""
+    counts = " UNION ALL ".join(
+        f"SELECT image_name, '{question}' AS question, {question} AS answer, COUNT(*) AS n "
+        f"FROM user_responses GROUP BY image_name, {question}" for question in QUESTIONS
+    )
+    with get_engine().begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Hold off new submissions so none is counted twice or missed
+            conn.exec_driver_sql("LOCK TABLE user_responses IN SHARE MODE")
+        image_rows = []
+        cluster_counts = Counter()
+        for image_name, question, answer, n in conn.execute(text(counts)):
+            cluster = image_cluster(image_name)
+            image_rows.append({"image_name": image_name, "question": question, "answer": answer,
+                               "cluster": cluster, "count": n})
+            cluster_counts[(cluster or UNCLUSTERED, question, answer)] += n
+
+        conn.execute(delete(ImageResponseRollup.__table__))
+        conn.execute(delete(ClusterResponseRollup.__table__))
+        if image_rows:
+            conn.execute(insert(ImageResponseRollup.__table__), image_rows)
+            conn.execute(insert(ClusterResponseRollup.__table__),
+                         [{"cluster": cluster, "question": question, "answer": answer, "count": n}
+                          for (cluster, question, answer), n in cluster_counts.items()])
+    return len(image_rows)
+
+
+def _distribution(rows):
+    questions = defaultdict(Counter)
+    for question, answer, n in rows:
+        questions[question][answer] += n
+    return {question: dict(answers) for question, answers in sorted(questions.items())}
+
+
+def distribution(image_name=None, cluster=None, question=None):
+    """{question: {answer: count}} for one image, one cluster, or everything.
+
+    Reads only rollup rows (an index range per image or cluster), never user_responses.
+    """
+    if image_name is not None:
+        table = ImageResponseRollup.__table__
+        query = select(table.c.question, table.c.answer, table.c.count).where(table.c.image_name == image_name)
+    else:
+        table = ClusterResponseRollup.__table__
+        query = select(table.c.question, table.c.answer, table.c.count)
+        if cluster is not None:
+            query = query.where(table.c.cluster == cluster)
+    if question is not None:
+        query = query.where(table.c.question == question)
+    with get_engine().connect() as conn:
+        return _distribution(conn.execute(query))
+
+
+def cluster_distributions(question=None):
+    """{cluster: {question: {answer: count}}} for every cluster, in one small query."""
+    table = ClusterResponseRollup.__table__
+    query = select(table.c.cluster, table.c.question, table.c.answer, table.c.count)
+    if question is not None:
+        query = query.where(table.c.question == question)
+    by_cluster = defaultdict(list)
+    with get_engine().connect() as conn:
+        for cluster, row_question, answer, n in conn.execute(query):
+            by_cluster[cluster or "unclustered"].append((row_question, answer, n))
+    return {cluster: _distribution(rows) for cluster, rows in sorted(by_cluster.items())}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Response distributions from the rollup tables.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the rollups from user_responses")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        print(f"✅ Rebuilt response rollups ({rebuild_rollups()} image/question/answer rows)")
+    print(json.dumps({"overall": distribution(), "clusters": cluster_distributions()}, indent=2))
@@ -0,0 +1,84 @@
+# responses.py
+#
+# Write path for survey answers. A whole form is stored with one multi-row INSERT, and
+# every row carries the form's submission_id: the unique (submission_id, image_name)
+# index turns a retried or double-clicked submission into a no-op instead of duplicates.
+# Rows that were actually inserted are added to the analytics rollups in the same
+# transaction (see response_analytics).
+import re
+import uuid
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from database import get_engine
+from models import UserResponse
+from response_analytics import QUESTIONS, update_rollups
+
+SUBMISSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def new_submission_id():
+    return uuid.uuid4().hex
+
+
+def valid_submission_id(value):
+    """The posted key if it looks like one of ours, else a fresh one (no dedup possible)."""
+    return value if value and SUBMISSION_ID_PATTERN.match(value) else new_submission_id()
+
+
+def rows_from_form(form, username, submission_id):
+    """One row per image_name_<i> field, numbered from 0 like the template renders them."""
+    now = datetime.utcnow()
+    rows = []
+    index = 0
+    while f'image_name_{index}' in form:
+        row = {
+            "username": username,
+            "image_name": form[f'image_name_{index}'],
+            "submission_id": submission_id,
+            "timestamp": now,
+        }
+        for question in QUESTIONS:
+            row[question] = form.get(f'{question}_{index}')
+        rows.append(row)
+        index += 1
+    return rows
+
+
+def _insert_ignoring_duplicates(dialect_name):
+    table = UserResponse.__table__
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(table).on_conflict_do_nothing(index_elements=["submission_id", "image_name"])
+
+
+def insert_responses(rows):
+    """Store the rows in one transaction and return those actually inserted.
+
+    Rows already stored under the same submission are skipped and not counted again.
+    """
+    if not rows:
+        return []
+    table = UserResponse.__table__
+    with get_engine().begin() as conn:
+        statement = _insert_ignoring_duplicates(conn.dialect.name)
+        if statement is not None and conn.dialect.insert_executemany_returning:
+            # executemany: batched into multi-row VALUES by SQLAlchemy's insertmanyvalues;
+            # RETURNING reports only the rows the conflict clause let through
+            result = conn.execute(statement.returning(table.c.image_name, *[table.c[q] for q in QUESTIONS]), rows)
+            inserted = [dict(row._mapping) for row in result]
+        else:
+            try:
+                with conn.begin_nested():
+                    conn.execute(insert(table), rows)
+                inserted = rows
+            except IntegrityError:
+                inserted = []  # the whole submission was already stored
+        update_rollups(conn, inserted)
+    return inserted
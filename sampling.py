@@ -0,0 +1,49 @@
+# sampling.py
+import numpy as np
+
+
+class EmployeeSampler:
+    """Draw employees without replacement from precomputed group index arrays.
+
+    Built once per dataset: row positions are grouped by `group_cols` (e.g. ["Gender"] or
+    ["Cluster", "Gender"]) and each draw runs a partial Fisher–Yates shuffle over the
+    remaining positions of a group, so a draw costs O(n) no matter how large the data is.
+    """
+
+    def __init__(self, df, group_cols=("Gender",), seed=None, id_col="EmployeeID"):
+        self.df = df
+        self.group_cols = list(group_cols)
+        self.rng = np.random.default_rng(seed)
+
+        # One row per employee, so an ID can never be drawn twice across groups
+        unique_positions = np.flatnonzero(~df[id_col].duplicated().to_numpy())
+        grouped = df.iloc[unique_positions].groupby(
+            self.group_cols if len(self.group_cols) > 1 else self.group_cols[0], observed=True, sort=False
+        )
+        self._pools = {key: unique_positions[idx] for key, idx in grouped.indices.items()}
+        self._remaining = {key: len(pool) for key, pool in self._pools.items()}
+
+    def remaining(self, group):
+        return self._remaining.get(group, 0)
+
+    def draw(self, group, n):
+        """Row positions of `n` not-yet-drawn employees from `group`."""
+        if self.remaining(group) < n:
+            raise ValueError("Not enough unique samples left.")
+
+        pool = self._pools[group]
+        m = self._remaining[group]
+        picks = self.rng.integers(0, np.arange(m, m - n, -1))
+        for k, j in enumerate(picks):
+            last = m - 1 - k
+            pool[j], pool[last] = pool[last], pool[j]
+        self._remaining[group] = m - n
+        return pool[m - n:m][::-1].copy()
+
+    def draw_pair(self, first_group, second_group, n):
+        """Draw `n` employees from each of two groups, checking both before consuming either."""
+        if self.remaining(first_group) < n or self.remaining(second_group) < n:
+            raise ValueError("Not enough unique samples left.")
+        first = self.df.iloc[self.draw(first_group, n)]
+        second = self.df.iloc[self.draw(second_group, n)]
+        return first, second
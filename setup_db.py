@@ -1,9 +1,39 @@
 # setup_db.py
 
+from sqlalchemy import inspect
+
 from database import engine
-from models import Base
+from models import Base, UserResponse, ModelPrediction
+
+
+def add_missing_columns(conn, model):
+    """ALTER TABLE ... ADD COLUMN for model columns an older version of the table lacks."""
+    table = model.__table__
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing and not column.primary_key:
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+    # create_all skips indexes of tables that already exist
+    for index in table.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def migrate_user_responses(conn):
+    """Bring a user_responses table created before idempotency keys up to the current schema."""
+    add_missing_columns(conn, UserResponse)
+
+
+def migrate_model_predictions(conn):
+    """model_predictions predates runs: add run_id, n_test, bootstrap statistics and created_at."""
+    add_missing_columns(conn, ModelPrediction)
+
 
 # This will create all tables defined in models.py
 Base.metadata.create_all(engine)
 
+with engine.begin() as conn:
+    migrate_user_responses(conn)
+    migrate_model_predictions(conn)
+
 print("✅ All tables created successfully on Render PostgreSQL.")
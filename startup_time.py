@@ -0,0 +1,108 @@
+# startup_time.py
+#
+# How long does `import app` take, and which packages is the time spent in?
+# Runs the import in a fresh interpreter with `-X importtime`, attributes each module's
+# own import time to its top-level package, and checks that the analysis stack
+# (numpy, pandas, matplotlib, ...) is not imported at web startup.
+#
+#   python startup_time.py                       # report for `import app`
+#   python startup_time.py --budget-ms 800       # exit 1 when startup is slower
+#   python startup_time.py --module analysis --forbid ""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+from collections import defaultdict
+
+DEFAULT_FORBIDDEN = "numpy,pandas,matplotlib,sklearn,yaml"
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure_import(module, python=sys.executable):
+    """(wall seconds, [(module, self_us, cumulative_us, depth)]) for one cold import."""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    started = time.perf_counter()
+    result = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"], capture_output=True,
+                            text=True, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return wall, entries
+
+
+def summarize(module, wall, entries, top=15):
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in entries:
+        by_package[name.split(".")[0]] += self_us
+    # -X importtime prints children before their parent, so the direct imports of `module`
+    # are the depth-1 lines since the previous top-level line
+    target, direct, children = 0, [], []
+    for name, _, cumulative, depth in entries:
+        if depth == 1:
+            children.append((name, cumulative))
+        elif depth == 0:
+            if name == module:
+                target, direct = cumulative, children
+            children = []
+    return {
+        "module": module,
+        "wall_ms": round(wall * 1000, 1),
+        "import_ms": round(target / 1000, 1),
+        "modules_imported": len(entries),
+        "packages": [{"package": name, "ms": round(us / 1000, 1)}
+                     for name, us in sorted(by_package.items(), key=lambda item: -item[1])[:top]],
+        "direct_imports": [{"module": name, "ms": round(us / 1000, 1)}
+                           for name, us in sorted(direct, key=lambda item: -item[1])[:top]],
+        "loaded": sorted(by_package),
+    }
+
+
+def print_summary(summary):
+    print(f"⏱️  import {summary['module']}: {summary['import_ms']:.0f} ms "
+          f"({summary['wall_ms']:.0f} ms including interpreter start, {summary['modules_imported']} modules)")
+    print("   By package (own import time):")
+    for entry in summary["packages"]:
+        print(f"     {entry['package']:<28} {entry['ms']:>8.1f} ms")
+    print(f"   Imported directly by {summary['module']} (cumulative):")
+    for entry in summary["direct_imports"]:
+        print(f"     {entry['module']:<28} {entry['ms']:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure cold import time of the web app, per package.")
+    parser.add_argument("--module", default="app", help="Module to import (default: app)")
+    parser.add_argument("--runs", type=int, default=3, help="Measure this many times and keep the fastest")
+    parser.add_argument("--top", type=int, default=15, help="Packages/imports to list")
+    parser.add_argument("--forbid", default=DEFAULT_FORBIDDEN,
+                        help="Comma-separated packages that must not be imported (empty to allow all)")
+    parser.add_argument("--budget-ms", type=float, help="Fail when the import takes longer than this")
+    parser.add_argument("--json", help="Also write the summary to this file")
+    args = parser.parse_args()
+
+    runs = [measure_import(args.module) for _ in range(max(1, args.runs))]
+    wall, entries = min(runs, key=lambda run: run[0])
+    summary = summarize(args.module, wall, entries, args.top)
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    failed = False
+    forbidden = sorted(set(filter(None, args.forbid.split(","))) & set(summary["loaded"]))
+    if forbidden:
+        print(f"❌ import {args.module} loads {', '.join(forbidden)}; import them lazily where they are used")
+        failed = True
+    if args.budget_ms is not None and summary["import_ms"] > args.budget_ms:
+        print(f"❌ import {args.module} took {summary['import_ms']:.0f} ms (budget {args.budget_ms:.0f} ms)")
+        failed = True
+    sys.exit(1 if failed else 0)
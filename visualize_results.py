@@ -2,23 +2,18 @@
 
 import pandas as pd
 import matplotlib.pyplot as plt
-from sqlalchemy import create_engine
+from database import get_engine
 
-# DB config
-db_config = {
-    'user': 'postgres',
-    'password': '1234',
-    'host': 'localhost',
-    'port': 5432,
-    'database': 'etl_pipeline_db'
-}
+engine = get_engine()
 
-engine = create_engine(
-    f"postgresql://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
-)
-
-# Load results
-df_results = pd.read_sql("SELECT * FROM model_predictions;", engine)
+# Load results of the latest evaluation run (rows from before run ids have none)
+df_results = pd.read_sql("""
+    SELECT * FROM model_predictions
+    WHERE run_id = (SELECT run_id FROM model_predictions WHERE run_id IS NOT NULL
+                    ORDER BY created_at DESC, id DESC LIMIT 1);
+""", engine)
+if df_results.empty:
+    df_results = pd.read_sql("SELECT * FROM model_predictions;", engine)
 
 # Plot
 plt.figure(figsize=(10, 5))